@@ -0,0 +1,286 @@
+'''
+Runtime engine built on top of asyncio.
+Process spawning, output reading, restart waits and shutdown all run on a single event loop.
+Requires Python 3.5+.
+'''
+import asyncio
+import collections
+import os
+import signal
+import subprocess
+import sys
+
+from .messaging import Line, SYSTEM_LABEL
+from .multiplexing import READ_CHUNK_SIZE, split_lines
+from .graph import DependencyGraph, DependencyTracker
+
+
+class AsyncExecutor(object):
+    '''
+    Runs, re-runs, stops services on the event loop.
+    Each executor is associated with exactly one service.
+    '''
+    def __init__(self, scheduler, service):
+        self._scheduler = scheduler
+        self._srv = service
+        self.name = service.name
+        self.returncode = None
+        self.child_pid = None
+
+    async def run(self):
+        '''
+        Run the underlying service till it exits.
+        '''
+        self._scheduler.send_system('starting service {s}'.format(s=self._srv.name))
+        try:
+            proc = await self._spawn()
+        except Exception:
+            self._exited(None)
+            return
+        self.child_pid = proc.pid
+        self._srv.pid = proc.pid
+        self._scheduler.send_system('{name} started (pid={pid})\n'.format(name=self.name, pid=proc.pid))
+        self._scheduler.executor_started(self)
+        carry = b''
+        while proc.stdout is not None:
+            chunk = await proc.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            lines, carry = split_lines(carry, chunk)
+            if lines:
+                self._output(lines)
+        if carry:
+            self._output(carry)
+        self._exited(await proc.wait())
+
+    def stop(self, force=False):
+        '''
+        Stop the underlying service.
+        '''
+        kill_type = 'forcefully' if force else 'gracefully'
+        msg = 'stopping service {name} (pid={pid}) {method}\n'. \
+                format(method=kill_type, name=self._srv.name, pid=self.child_pid)
+        self._scheduler.send_system(msg)
+        self._srv.stop(force=force)
+
+    def needs_restart(self):
+        '''
+        Must underlying service be restarted?
+        '''
+        return self._srv.readiness.needs_retry()
+
+    def reset(self):
+        '''
+        Reset return code of the service.
+        '''
+        self.returncode = None
+        self.child_pid = None
+        self._srv.readiness.update_service_state(self.returncode)
+        self._srv.readiness.retry.do_retry()
+
+    async def _spawn(self):
+        output = self._srv.open_output()
+        params = {
+            'env': self._srv.env,
+            'cwd': self._srv.cwd,
+            'stdout': subprocess.PIPE if output is None else output,
+            'stderr': subprocess.STDOUT,
+            'close_fds': True,
+        }
+        try:
+            if self._srv.in_shell:
+                return await asyncio.create_subprocess_shell(self._srv.command(), **params)
+            return await asyncio.create_subprocess_exec(*self._srv.command(), **params)
+        finally:
+            if output is not None:
+                output.close()
+
+    def _output(self, lines):
+        if not self._srv.quiet:
+            self._scheduler.write(Line(data=lines, name=self._srv.name, color=self._srv.color))
+
+    def _exited(self, returncode):
+        self.returncode = returncode
+        self._srv.readiness.update_service_state(returncode)
+        self._scheduler.executor_stopped(self)
+
+
+class AsyncScheduler(object):
+    '''
+    Manager for scheduling, running, stopping and monitoring services on the asyncio event loop.
+    Has the same interface as the threaded Scheduler.
+    Services are started as soon as the services they depend on are ready.
+    '''
+    def __init__(self, printer, kill_wait=5):
+        self.returncode = None
+        self.kill_wait = kill_wait
+        self._printer = printer
+        self._executors = collections.OrderedDict()
+        self._dependencies = collections.OrderedDict()
+        self._tracker = None
+        self._loop = None
+        self._idle_scheduled = False
+        self._done = None
+        self._running = 0
+        self._pending_restarts = 0
+        self._terminating = False
+        self.signals = {
+            signal.SIGINT: {
+                'name': 'SIGINT',
+                'rc': 130,
+            },
+            signal.SIGTERM: {
+                'name': 'SIGTERM',
+                'rc': 143,
+            },
+        }
+
+    def register_service(self, service):
+        '''
+        Register Service within the Scheduler.
+        '''
+        self._executors[service.name] = AsyncExecutor(self, service)
+        self._dependencies[service.name] = service.depends_on
+        self._printer.register(service)
+
+    def start(self):
+        '''
+        Start the main managing and execution logic of the Scheduler.
+        Blocks till all the services have exited.
+        '''
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            _use_pidfd_child_watcher(self._loop)
+            self._loop.run_until_complete(self._main())
+        finally:
+            asyncio.set_event_loop(None)
+            self._loop.close()
+            self._printer.close()
+
+    def terminate(self):
+        '''
+        Stop (maybe forcefully) the Scheduler.
+        '''
+        if self._terminating:
+            return
+        self._terminating = True
+        # Services still waiting for their dependencies will never start
+        if self._tracker is not None:
+            self._tracker.skip_waiting()
+        self._stop_running()
+        self._loop.call_later(self.kill_wait, self._stop_running, True)
+        self._check_done()
+
+    def terminate_by_signal(self, signum):
+        '''
+        Stop the Scheduler because of the OS signal. Safe to call from a signal handler.
+        '''
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._terminate_by_signal, signum)
+
+    def send_system(self, data):
+        '''
+        Output a system-type message.
+        '''
+        self.write(Line(data=data, name=SYSTEM_LABEL))
+
+    def write(self, message):
+        '''
+        Output a message.
+        '''
+        self._printer.write(message)
+        # Writers are notified about idleness once the loop has processed all the ready callbacks
+        if not self._idle_scheduled:
+            self._idle_scheduled = True
+            self._loop.call_soon(self._idle)
+
+    def executor_started(self, executor):
+        '''
+        Handle the start of the service run by the executor.
+        '''
+        self._launch_all(self._tracker.service_started(executor.name))
+
+    def executor_stopped(self, executor):
+        '''
+        Handle the exit of the service run by the executor.
+        '''
+        self._running -= 1
+        rc = executor.returncode
+        self.send_system('{name} stopped (rc={rc})\n'.format(name=executor.name, rc=rc))
+        if self.returncode is None:
+            self.returncode = rc
+        needs_restart, wait_sec = executor.needs_restart()
+        needs_restart = needs_restart and not self._terminating
+        if needs_restart:
+            executor.reset()
+            self._pending_restarts += 1
+            self._loop.call_later(wait_sec, self._restart, executor)
+        ready, skipped = self._tracker.service_exited(executor.name, rc, needs_restart)
+        for name, failed in skipped:
+            self.send_system('{name} is skipped as {failed} has failed\n'.format(name=name, failed=failed))
+        self._launch_all(ready)
+        self._check_done()
+
+    def _idle(self):
+        self._idle_scheduled = False
+        self._printer.idle()
+
+    async def _main(self):
+        self._done = asyncio.Event()
+        self._tracker = DependencyTracker(DependencyGraph(self._dependencies))
+        self._launch_all(self._tracker.start())
+        self._check_done()
+        await self._done.wait()
+
+    def _launch_all(self, names):
+        if self._terminating:
+            return
+        for name in names:
+            self._launch(self._executors[name])
+
+    def _launch(self, executor):
+        self._running += 1
+        asyncio.ensure_future(executor.run())
+
+    def _restart(self, executor):
+        self._pending_restarts -= 1
+        if self._terminating:
+            self._check_done()
+            return
+        self.send_system('{name} is restarting\n'.format(name=executor.name))
+        self._launch(executor)
+
+    def _stop_running(self, force=False):
+        for executor in self._executors.values():
+            if executor.returncode is None and executor.child_pid is not None:
+                executor.stop(force)
+
+    def _check_done(self):
+        if self._running == 0 and (self._pending_restarts == 0 or self._terminating):
+            self._terminating = True
+            self._done.set()
+
+    def _terminate_by_signal(self, signum):
+        self.send_system('%s received\n' % self.signals[signum]['name'])
+        self.returncode = self.signals[signum]['rc']
+        self.terminate()
+
+
+def _use_pidfd_child_watcher(loop):
+    '''
+    Make asyncio wait for children with pidfd on the event loop itself instead of a thread per child.
+    Python 3.12+ does this by default, older versions need to be told explicitly.
+    '''
+    watcher_class = getattr(asyncio, 'PidfdChildWatcher', None)
+    if watcher_class is None or sys.version_info >= (3, 12):
+        return
+    try:
+        # Kernels older than 5.3 don't support pidfd
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        return
+    watcher = watcher_class()
+    watcher.attach_loop(loop)
+    asyncio.set_child_watcher(watcher)
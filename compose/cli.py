@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
+import datetime
+import re
 import subprocess
 import sys
 
 import click
 
-from .configuration import Config
+from .configuration import Config, ConfigCache
 from .runtime import Scheduler, Runner
 from .printing import Printer, WritersFactory
+from .logfiles import log_file_path
+from .messaging import OVERFLOW_BLOCK
 from .info import VERSION, CONFIG_FILE_NAME, NAME
 from .system import Storage
 
 
 UP_DETACHED_FLAGS = ['-d', '--detached']
+ENGINE_THREADS = 'threads'
+ENGINE_ASYNCIO = 'asyncio'
 
 @click.group()
 def root():
@@ -61,17 +67,33 @@ def example():
 @click.option('-w', '--workdir', show_default=True, default='.', help='Work dir')
 @click.option(*UP_DETACHED_FLAGS, is_flag=True, show_default=True, help='Detached mode: Run services in the background')
 @click.option('--color/--no-color', default=True, show_default=True, help='Use colored output?')
-def up(file, workdir, detached, color):
+@click.option('--engine', type=click.Choice([ENGINE_THREADS, ENGINE_ASYNCIO]), default=ENGINE_THREADS,
+              show_default=True, help='Runtime engine that runs services')
+def up(file, workdir, detached, color, engine):
     '''
     Start services
     '''
-    conf = Config(file, workdir).try_parse()
+    if engine == ENGINE_ASYNCIO and sys.version_info < (3, 5):
+        click.echo('Engine "%s" requires Python 3.5+' % engine)
+        sys.exit(1)
+    conf = Config(file, workdir, ConfigCache()).try_parse()
     storage = Storage(conf.config_file_path)
-    printer = Printer(WritersFactory(conf, storage.get_tempdir_name(), color).create(),
+    writers_factory = WritersFactory(conf, storage.get_tempdir_name(), color)
+    printer = Printer(writers_factory.create(),
                       time_format=conf.logging.get('timeFormat'),
-                      use_prefix=conf.logging.get('usePrefix', True))
-    scheduler = Scheduler(printer=printer)
+                      use_prefix=conf.logging.get('usePrefix', True),
+                      binary=conf.logging.get('binary', False))
+    if engine == ENGINE_ASYNCIO:
+        # asyncio engine is Python 3 only, so it's imported on demand
+        from .aio import AsyncScheduler
+        scheduler = AsyncScheduler(printer=printer)
+    else:
+        buffer_conf = conf.logging.get('buffer', {})
+        scheduler = Scheduler(printer=printer,
+                              max_buffered_lines=buffer_conf.get('maxLines'),
+                              overflow=buffer_conf.get('overflow', OVERFLOW_BLOCK))
     for s in conf.services:
+        writers_factory.redirect_output(s)
         scheduler.register_service(s)
     runner = Runner(storage, scheduler)
     try:
@@ -95,21 +117,104 @@ def down(file, workdir):
     '''
     Stop services
     '''
-    conf = Config(file, workdir).try_parse()
+    conf = Config(file, workdir, ConfigCache()).try_parse()
     runner = Runner(Storage(conf.config_file_path), None)
     runner.down()
     click.echo('Stopped %s' % (NAME,))
 
 
+def _time_bound(_ctx, _param, value):
+    if value is None:
+        return None
+    from .logs import parse_time
+    try:
+        return parse_time(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
 @root.command()
-@click.argument('service')
+@click.argument('services', nargs=-1)
 @click.option('-f', '--file', show_default=True, default=CONFIG_FILE_NAME, help='Configuration file')
 @click.option('-w', '--workdir', show_default=True, default='.', help='Work dir')
 @click.option('--color/--no-color', default=True, show_default=True, help='Use colored output?')
-def logs(service, file, workdir, color):
+@click.option('--since', callback=_time_bound,
+              help='Show output since the time: HH:MM[:SS] of today or YYYY-MM-DD[ HH:MM[:SS]]')
+@click.option('--until', callback=_time_bound, help='Show output till the time (inclusive), same formats as --since')
+@click.option('-n', '--tail', type=click.IntRange(min=0), help='Show only the given number of the last lines')
+@click.option('--follow', is_flag=True, help='Keep showing the new output as it comes')
+@click.option('--grep', 'pattern', help='Show only the lines matching the regular expression '
+              '(all the services are searched if none is given)')
+@click.option('--merged', is_flag=True, help='Show output of several services (all if none is given) ordered by time')
+def logs(services, file, workdir, color, since, until, tail, follow, pattern, merged):
     '''
     Get service logs
     '''
-    conf = Config(file, workdir).try_parse()
-    _ = Storage(conf.config_file_path)
-    click.echo('Not implemented yet')
+    if tail is not None and (since is not None or until is not None):
+        raise click.UsageError('--tail can\'t be used together with --since or --until')
+    if follow and until is not None:
+        raise click.UsageError('--follow can\'t be used together with --until')
+    if pattern is not None and (tail is not None or follow or since is not None or until is not None):
+        raise click.UsageError('--grep can\'t be used together with --tail, --follow, --since or --until')
+    if merged and (tail is not None or follow or pattern is not None):
+        raise click.UsageError('--merged can\'t be used together with --tail, --follow or --grep')
+    if pattern is None and not merged and len(services) != 1:
+        raise click.UsageError('Exactly one service is expected')
+    # Log reading machinery is heavy to import and is needed only here
+    from .logs import ServiceLog, LogFollower, merge
+    conf = Config(file, workdir, ConfigCache()).try_parse()
+    storage = Storage(conf.config_file_path)
+    defined = dict((s.name, s) for s in conf.services)
+    for name in services:
+        if name not in defined:
+            click.echo('Service "%s" is not defined' % name)
+            sys.exit(1)
+    service_logs = []
+    for name in services or sorted(defined):
+        service_logs.append((name, ServiceLog(log_file_path(storage.get_tempdir_name(), defined[name]))))
+    out = click.get_binary_stream('stdout')
+    if pattern is not None:
+        _grep_logs(out, service_logs, pattern)
+        return
+    if merged:
+        lines = merge([service_log for _, service_log in service_logs],
+                      since=since and since[0], until=until and until[1])
+        out.writelines(lines)
+        out.flush()
+        return
+    service_log = service_logs[0][1]
+    if not service_log.segments() and not follow:
+        click.echo('No logs of service "%s" found. Is logging to file enabled?' % services[0])
+        sys.exit(1)
+    if tail is not None:
+        blocks = service_log.tail(tail)
+    else:
+        blocks = service_log.read(since=since and since[0], until=until and until[1])
+    for block in blocks:
+        out.write(block)
+    out.flush()
+    if follow:
+        try:
+            for block in LogFollower(service_log.path).blocks():
+                out.write(block)
+                out.flush()
+        except KeyboardInterrupt:
+            pass
+
+
+def _grep_logs(out, service_logs, pattern):
+    from .logs import grep
+    pattern = pattern.encode('utf-8')
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise click.BadParameter(str(e), param_hint='--grep')
+    width = max(len(name) for name, _ in service_logs)
+    for name, epoch, line in grep(service_logs, pattern):
+        if epoch is None:
+            time = '-'.ljust(19)
+        else:
+            time = datetime.datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
+        prefix = '{name} {time} | '.format(name=name.ljust(width), time=time)
+        out.write(prefix.encode('utf-8') + line + b'\n')
+    out.flush()
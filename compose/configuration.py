@@ -2,15 +2,17 @@ from __future__ import print_function
 import sys
 import os
 import os.path
+import collections
 import difflib
-
-import yaml
-import jsonschema
-from dotenv import dotenv_values
+import hashlib
+import json
 
 from .schema import JSON_SCHEMA
+from .validation import compile_schema
+from .logfiles import compression_available
+from .graph import DependencyGraph, DependencyError, CONDITION_STARTED
 from .service import Service
-from .info import CONFIG_EXAMPLE
+from .info import CONFIG_EXAMPLE, NAME, VERSION
 from .printing import ColoredPrintWriter
 
 
@@ -18,11 +20,15 @@ class Config(object):
     '''
     Main and only class that is responsible for configuration.
     '''
-    def __init__(self, filename, workdir=None):
+    def __init__(self, filename, workdir=None, cache=None):
         if workdir is None:
             workdir = '.'
         self._full_config_file_path = os.path.realpath(os.path.expanduser(os.path.join(workdir, filename)))
         self._conf = None
+        self._cache = cache
+        self._services = None
+        self._env_maps_merged = {}
+        self._dotenv_loaded = {}
 
     @staticmethod
     def example():
@@ -44,11 +50,23 @@ class Config(object):
         Validates it.
         Returns a configuration dict.
         '''
+        self._services = None
+        self._env_maps_merged = {}
+        self._dotenv_loaded = {}
         try:
             contents = self.read()
-            data = yaml.safe_load(contents)
+            if self._cache is not None:
+                data = self._cache.load(self.config_file_path, contents)
+                if data is not None:
+                    self._conf = data
+                    self._validate_settings()
+                    self._validate_services()
+                    return self
+            data = _load_yaml(contents)
             self._conf = data
             self.validate(data)
+            if self._cache is not None:
+                self._cache.store(self.config_file_path, contents, data, self._dotenv_paths())
             return self
         except Exception as e:
             raise ConfigurationError('Configuration file "%s" is invalid.\nErrors:\n%s' % \
@@ -70,18 +88,10 @@ class Config(object):
         '''
         if data is None:
             raise ConfigurationError('File is empty.')
-        # Extend jsonschema validator to respect default values in schema.
-        def extend_with_default(validator_class):
-            validate_properties = validator_class.VALIDATORS['properties']
-            def set_defaults(validator, properties, instance, schema):
-                for property, subschema in properties.items():
-                    if 'default' in subschema:
-                        instance.setdefault(property, subschema['default'])
-                for error in validate_properties(validator, properties, instance, schema):
-                    yield error
-            return jsonschema.validators.extend(validator_class, {'properties' : set_defaults})
-        DefaultValidatingDraft7Validator = extend_with_default(jsonschema.Draft7Validator)
-        DefaultValidatingDraft7Validator(JSON_SCHEMA).validate(data)
+        if not _fast_validator()(data):
+            # The fast validator can only tell that the config is invalid, jsonschema finds out why
+            _schema_validator().validate(data)
+        self._validate_settings()
         self._validate_services()
 
     def read(self):
@@ -97,7 +107,15 @@ class Config(object):
     @property
     def services(self):
         '''
-        Build and get Service objects.
+        Get Service objects. They are built once per parse.
+        '''
+        if self._services is None:
+            self._services = self._build_services()
+        return self._services
+
+    def _build_services(self):
+        '''
+        Build Service objects.
         '''
         services = []
         for name, srv_conf in self._conf.get('services', {}).items():
@@ -116,6 +134,8 @@ class Config(object):
                 params['readiness'] = srv_conf['readiness']
             if 'logToFile' in srv_conf:
                 params['log_to_file'] = srv_conf['logToFile']
+            if 'dependsOn' in srv_conf:
+                params['depends_on'] = self._dependencies(srv_conf['dependsOn'])
             s = Service(name, srv_conf.get('run'), **params)
             services.append(s)
         return services
@@ -155,14 +175,25 @@ class Config(object):
         '''
         return self._conf.get('envMaps', {})
 
+    def _validate_settings(self):
+        '''
+        Validate settings that depend on the environment
+        '''
+        compression = self.logging['toFile']['compression']
+        if not compression_available(compression):
+            raise ConfigurationError('Compression "%s" of log files is not supported by Python %d.%d' %
+                                     (compression, sys.version_info[0], sys.version_info[1]))
+
     def _validate_services(self):
         '''
         Validate each service config properties
         '''
-        allowed_colors = self.available_colors()
+        allowed_colors = None
         for srv in self.services:
             # color
             if srv.color is not None:
+                if allowed_colors is None:
+                    allowed_colors = self.available_colors()
                 if srv.color not in allowed_colors:
                     suggested_colors = difflib.get_close_matches(srv.color, allowed_colors, n=1)
                     msg = "Color '%s' for service '%s' is not allowed." % (srv.color, srv.name)
@@ -173,6 +204,30 @@ class Config(object):
             if srv.cwd is not None:
                 if not os.path.exists(srv.cwd):
                     raise ConfigurationError('Directory "%s" for service "%s" not found' % (srv.cwd, srv.name))
+        # dependsOn
+        try:
+            DependencyGraph(collections.OrderedDict((srv.name, srv.depends_on) for srv in self.services))
+        except DependencyError as e:
+            raise ConfigurationError(str(e))
+
+    @staticmethod
+    def _dependencies(depends_on):
+        '''
+        Get dependencies of a service as dict of service name -> readiness condition.
+        '''
+        if isinstance(depends_on, list):
+            return collections.OrderedDict((name, CONDITION_STARTED) for name in depends_on)
+        return collections.OrderedDict((name, dep['condition']) for name, dep in depends_on.items())
+
+    def _dotenv_paths(self):
+        '''
+        Paths of the .env files the services read their env variables from.
+        '''
+        paths = []
+        for srv_conf in self._conf.get('services', {}).values():
+            if srv_conf.get('envFromDotenv', False):
+                paths.append(os.path.join(self._compute_work_dir(srv_conf.get('cwd', '')), '.env'))
+        return paths
 
     def _compute_work_dir(self, work_dir):
         '''
@@ -198,25 +253,210 @@ class Config(object):
         lookup_env_maps = srv_conf.get('envFromMap', [])
         from_dot_env = srv_conf.get('envFromDotenv', False)
         from_os = srv_conf.get('envFromOS', False)
-        all_maps = self.env_maps
-        final = {}
         # envFromMap goes first
-        for m in lookup_env_maps:
-            if m not in all_maps:
-                raise ConfigurationError('EnvMap "%s" is unknown and is missing in the envMaps' % m)
-            final.update(all_maps[m])
+        final = dict(self._merge_env_maps(tuple(lookup_env_maps)))
         # env goes next
         final.update(env_from_env)
         # .env files from the working dir goes next
         if from_dot_env:
-            cwd = self._compute_work_dir(srv_conf.get('cwd', ''))
-            loaded_envs = dotenv_values(dotenv_path=os.path.join(cwd, '.env'))
-            final.update(loaded_envs)
+            final.update(self._load_dotenv(self._compute_work_dir(srv_conf.get('cwd', ''))))
         # OS current session env variables go next
         if from_os:
             final.update(os.environ)
         return final
 
+    def _merge_env_maps(self, names):
+        '''
+        Merge the env maps in the given order. Results are memoized as services often share the same maps.
+        '''
+        merged = self._env_maps_merged.get(names)
+        if merged is None:
+            all_maps = self.env_maps
+            merged = {}
+            for m in names:
+                if m not in all_maps:
+                    raise ConfigurationError('EnvMap "%s" is unknown and is missing in the envMaps' % m)
+                merged.update(all_maps[m])
+            self._env_maps_merged[names] = merged
+        return merged
+
+    def _load_dotenv(self, work_dir):
+        '''
+        Load variables from the .env file in the working directory. Each file is read only once per parse.
+        '''
+        loaded = self._dotenv_loaded.get(work_dir)
+        if loaded is None:
+            from dotenv import dotenv_values
+            loaded = self._dotenv_loaded[work_dir] = dotenv_values(dotenv_path=os.path.join(work_dir, '.env'))
+        return loaded
+
+
+def _load_yaml(contents):
+    '''
+    Parse yaml with the libyaml based loader if PyYAML was built with it, it's several times faster.
+    '''
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(contents, Loader=loader)
+
+
+_validator = None
+_fast_check = None
+
+
+def _fast_validator():
+    '''
+    Get the function compiled from JSON_SCHEMA that checks configs and fills in default values.
+    It's compiled once on the first use.
+    '''
+    global _fast_check
+    if _fast_check is None:
+        _fast_check = compile_schema(JSON_SCHEMA)
+    return _fast_check
+
+
+def _schema_validator():
+    '''
+    Get validator of configs against JSON_SCHEMA. It's built once on the first use.
+    The validator also fills in default values from the schema.
+    '''
+    global _validator
+    if _validator is None:
+        import jsonschema
+        validate_properties = jsonschema.Draft7Validator.VALIDATORS['properties']
+        def set_defaults(validator, properties, instance, schema):
+            for property, subschema in properties.items():
+                if 'default' in subschema:
+                    instance.setdefault(property, subschema['default'])
+            for error in validate_properties(validator, properties, instance, schema):
+                yield error
+        validator_class = jsonschema.validators.extend(jsonschema.Draft7Validator, {'properties': set_defaults})
+        _validator = validator_class(JSON_SCHEMA)
+    return _validator
+
+
+# How many config files the cache keeps entries for
+CONFIG_CACHE_SIZE = 64
+
+
+class ConfigCache(object):
+    '''
+    Persistent cache of parsed, validated and defaults-applied configs. Each config file has its own JSON entry.
+    The entry is used while the contents of the config file, the code that parses and validates it
+    and modification times of the .env files its services read stay the same.
+    Only max_entries most recently used entries are kept.
+    '''
+    def __init__(self, cache_dir=None, max_entries=CONFIG_CACHE_SIZE):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), NAME)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def load(self, config_path, contents):
+        '''
+        Get the cached config data or None if there is no valid entry.
+        '''
+        try:
+            with open(self._entry_path(config_path)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get('hash') != self._hash(contents):
+            return None
+        for path, mtime in entry.get('dotenv', {}).items():
+            if _mtime(path) != mtime:
+                return None
+        try:
+            # Mark the entry as recently used
+            os.utime(self._entry_path(config_path), None)
+        except OSError:
+            pass
+        return entry.get('conf')
+
+    def store(self, config_path, contents, data, dotenv_paths):
+        '''
+        Save the config data. Data that can't be represented in JSON as is (e.g. dates) is not cached.
+        '''
+        entry = {
+            'hash': self._hash(contents),
+            'dotenv': dict((p, _mtime(p)) for p in dotenv_paths),
+            'conf': data,
+        }
+        try:
+            text = json.dumps(entry)
+            if json.loads(text)['conf'] != data:
+                return
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            path = self._entry_path(config_path)
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'w') as f:
+                f.write(text)
+            os.rename(tmp, path)
+            self._prune()
+        except (IOError, OSError, TypeError, ValueError):
+            # Cache is only an optimization, config still works without it
+            pass
+
+    def _prune(self):
+        '''
+        Remove the least recently used entries over max_entries.
+        '''
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.cache_dir, name)
+                entries.append((_mtime(path) or 0, path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _entry_path(self, config_path):
+        box = hashlib.md5()
+        box.update(config_path.encode('utf-8'))
+        return os.path.join(self.cache_dir, box.hexdigest() + '.json')
+
+    @staticmethod
+    def _hash(contents):
+        if not isinstance(contents, bytes):
+            contents = contents.encode('utf-8')
+        box = hashlib.sha1(_code_digest())
+        box.update(contents)
+        return box.hexdigest()
+
+
+_digest = None
+
+
+def _code_digest():
+    '''
+    Digest of the code that turns a config file into the config data: the schema (with its defaults),
+    the validators and this module. Version alone isn't enough as the code may change without its bump.
+    Sources are hashed rather than JSON_SCHEMA itself since validation fills in defaults inside the schema.
+    '''
+    global _digest
+    if _digest is None:
+        from . import schema, validation
+        box = hashlib.sha1(VERSION.encode('utf-8'))
+        for module in (schema, validation, sys.modules[__name__]):
+            path = module.__file__
+            if path.endswith('.pyc') and os.path.exists(path[:-1]):
+                path = path[:-1]
+            with open(path, 'rb') as f:
+                box.update(f.read())
+        _digest = box.digest()
+    return _digest
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
 
 class ConfigurationError(ValueError):
     '''
@@ -0,0 +1,157 @@
+import collections
+
+
+# When a dependency is considered ready:
+# its process has started
+CONDITION_STARTED = 'started'
+# its process has exited with 0 return code
+CONDITION_COMPLETED_SUCCESSFULLY = 'completedSuccessfully'
+
+
+class DependencyGraph(object):
+    '''
+    Directed acyclic graph of dependencies between services.
+    dependencies - dict of service name -> dict of the names of services it depends on -> condition.
+    Services keep the order they are given in.
+    '''
+    def __init__(self, dependencies):
+        self._dependencies = collections.OrderedDict()
+        self._dependents = collections.OrderedDict()
+        for name in dependencies:
+            self._dependents[name] = []
+        for name, deps in dependencies.items():
+            self._dependencies[name] = deps
+            for dep in deps:
+                if dep not in self._dependents:
+                    raise DependencyError('Service "%s" depends on unknown service "%s"' % (name, dep))
+                self._dependents[dep].append(name)
+        self._waves = self._build_waves()
+
+    def names(self):
+        '''
+        Names of all the services.
+        '''
+        return list(self._dependencies)
+
+    def dependencies(self, name):
+        '''
+        Dict of the services the service depends on -> condition.
+        '''
+        return self._dependencies[name]
+
+    def dependents(self, name):
+        '''
+        Names of the services that depend on the service.
+        '''
+        return self._dependents[name]
+
+    def waves(self):
+        '''
+        Services split into waves: each service depends only on services of the previous waves.
+        '''
+        return self._waves
+
+    def _build_waves(self):
+        # Kahn's algorithm, a wave at a time
+        unmet = dict((name, len(deps)) for name, deps in self._dependencies.items())
+        wave = [name for name in self._dependencies if unmet[name] == 0]
+        waves = []
+        while wave:
+            waves.append(wave)
+            following = []
+            for name in wave:
+                for dependent in self._dependents[name]:
+                    unmet[dependent] -= 1
+                    if unmet[dependent] == 0:
+                        following.append(dependent)
+            wave = following
+        if sum(len(w) for w in waves) < len(self._dependencies):
+            raise DependencyError('Services depend on each other in a cycle: %s' %
+                                  ' -> '.join(self._find_cycle(unmet)))
+        return waves
+
+    def _find_cycle(self, unmet):
+        # Every service left with unmet dependencies depends on another such service, so walking
+        # from any of them along those dependencies eventually comes back to a visited one
+        name = next(n for n in self._dependencies if unmet[n] > 0)
+        path = []
+        while name not in path:
+            path.append(name)
+            name = next(d for d in self._dependencies[name] if unmet[d] > 0)
+        return path[path.index(name):] + [name]
+
+
+class DependencyTracker(object):
+    '''
+    Decides when services can be started according to their dependencies.
+    Gets notified about services' starts and exits and tells which services must be started or skipped because of them.
+    Services that don't depend on each other are started together as soon as their dependencies are ready.
+    '''
+    def __init__(self, graph):
+        self._graph = graph
+        self._waiting = collections.OrderedDict((name, set(graph.dependencies(name))) for name in graph.names())
+
+    def start(self):
+        '''
+        Names of the services that can be started right away.
+        '''
+        return self._ready()
+
+    def service_started(self, name):
+        '''
+        Handle the start of the service. Returns names of the services that can be started now.
+        '''
+        self._satisfy(name, CONDITION_STARTED)
+        return self._ready()
+
+    def service_exited(self, name, returncode, restarting=False):
+        '''
+        Handle the exit of the service (returncode is None if it has failed to start).
+        Returns names of the services that can be started now
+        and (name, failed dependency name) of the services that will never be started.
+        '''
+        skipped = []
+        if returncode == 0:
+            self._satisfy(name, CONDITION_COMPLETED_SUCCESSFULLY)
+        elif not restarting:
+            for dependent in self._graph.dependents(name):
+                if name in self._waiting.get(dependent, ()):
+                    self._skip(dependent, name, skipped)
+        return self._ready(), skipped
+
+    def skip_waiting(self):
+        '''
+        Give up on all the services that haven't been started yet. Returns their names.
+        '''
+        names = list(self._waiting)
+        self._waiting.clear()
+        return names
+
+    def _satisfy(self, name, condition):
+        for dependent in self._graph.dependents(name):
+            unmet = self._waiting.get(dependent)
+            # A service that has completed has started too
+            if unmet is not None and name in unmet and \
+                    (condition == CONDITION_COMPLETED_SUCCESSFULLY or
+                     self._graph.dependencies(dependent)[name] == CONDITION_STARTED):
+                unmet.discard(name)
+
+    def _skip(self, name, failed, skipped):
+        if self._waiting.pop(name, None) is None:
+            return
+        skipped.append((name, failed))
+        for dependent in self._graph.dependents(name):
+            self._skip(dependent, name, skipped)
+
+    def _ready(self):
+        ready = [name for name, unmet in self._waiting.items() if not unmet]
+        for name in ready:
+            del self._waiting[name]
+        return ready
+
+
+class DependencyError(ValueError):
+    '''
+    Dependencies between services are invalid.
+    '''
+    pass
@@ -0,0 +1,416 @@
+import gzip
+import itertools
+import os
+import shutil
+import struct
+import sys
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .info import NAME
+from .utils import monotonic
+
+
+# Size of the in-memory buffer of each opened log file
+FILE_BUFFER_SIZE = 256 * 1024
+
+# Entry of the sparse time index of a log file:
+# epoch second and offset of the first line written in that second
+INDEX_ENTRY = struct.Struct('!qQ')
+
+# Compression of rotated log files
+COMPRESSION_NONE = 'none'
+COMPRESSION_GZIP = 'gzip'
+COMPRESSION_LZMA = 'lzma'
+
+# File name suffixes of compressed log files
+COMPRESSION_SUFFIXES = {
+    COMPRESSION_GZIP: '.gz',
+    COMPRESSION_LZMA: '.xz',
+}
+
+
+def log_file_path(store_temp_dir, service):
+    '''
+    Path of the log file of the service.
+    '''
+    if service.log_to_file:
+        return service.log_to_file
+    return os.path.join(store_temp_dir, '%s.log' % service.name)
+
+
+def index_path(path):
+    '''
+    Path of the time index of the log file.
+    '''
+    return path + '.idx'
+
+
+def compression_available(compression):
+    '''
+    Can log files be compressed this way by the current Python?
+    '''
+    if compression != COMPRESSION_LZMA:
+        return True
+    try:
+        # lzma is Python 3 only
+        import lzma
+    except ImportError:
+        return False
+    return True
+
+
+def open_segment(path):
+    '''
+    Open the log file for reading in binary mode. Compressed files are decompressed transparently.
+    '''
+    if path.endswith(COMPRESSION_SUFFIXES[COMPRESSION_GZIP]):
+        return gzip.open(path, 'rb')
+    if path.endswith(COMPRESSION_SUFFIXES[COMPRESSION_LZMA]):
+        # lzma is Python 3 only, so it's imported on demand
+        import lzma
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def report_error(message, error):
+    '''
+    Report an error that happened in a background thread, where it can't be raised to anyone.
+    '''
+    sys.stderr.write('%s: %s: %s\n' % (NAME, message, error))
+
+
+class LogFile(object):
+    '''
+    Append-only log file of a service.
+    Its size is tracked in memory and the file is rotated when it exceeds max_bytes (if set):
+    the current file becomes <path>.1, the previous <path>.1 becomes <path>.2 and so on.
+    Only backup_count rotated files are kept.
+    If compressor is given, rotated files are compressed by it in the background.
+    Each file has a sparse time index alongside (see INDEX_ENTRY) that is rotated together with it.
+    '''
+    def __init__(self, path, max_bytes=0, backup_count=0, compressor=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compressor = compressor
+        self.size = 0
+        self._file = None
+        self._index = None
+        self._epoch = None
+        self._indexed_epoch = None
+
+    def backup_path(self, number):
+        '''
+        Path of the rotated file with the given number.
+        '''
+        suffix = '' if self.compressor is None else self.compressor.suffix
+        return '%s.%d%s' % (self.path, number, suffix)
+
+    def write(self, data):
+        '''
+        Append data to the file. The file is opened on the first write.
+        '''
+        if self._file is None:
+            self._open()
+        if self.max_bytes and self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self._file.write(data)
+        self.size += len(data)
+
+    def write_lines(self, lines, marks=None):
+        '''
+        Append the lines to the file with as few writes as possible, rotating the file in between lines if needed.
+        marks - dict of line number -> epoch second the line (and the following ones) was output at.
+        '''
+        if self._file is None:
+            self._open()
+        if not self.max_bytes and not marks:
+            self.write(b''.join(lines))
+            return
+        start = 0
+        size = self.size
+        for i, line in enumerate(lines):
+            if self.max_bytes and size and size + len(line) > self.max_bytes:
+                if i > start:
+                    self.write(b''.join(lines[start:i]))
+                self.rotate()
+                start = i
+                size = 0
+            if marks and i in marks:
+                self._epoch = marks[i]
+            if self._epoch != self._indexed_epoch:
+                self._index.write(INDEX_ENTRY.pack(self._epoch, size))
+                self._indexed_epoch = self._epoch
+            size += len(line)
+        self.write(b''.join(lines[start:]))
+
+    def rotate(self):
+        '''
+        Rotate the file: shift the previous rotated files and start the new one.
+        '''
+        self.close()
+        if self.backup_count == 0:
+            os.remove(self.path)
+            _move_index(self.path, None)
+        elif self.compressor is None:
+            self.shift_backups()
+            _move_segment(self.path, self.backup_path(1))
+        else:
+            pending_path = self.compressor.pending_path(self.path)
+            _move_segment(self.path, pending_path)
+            self.compressor.send(self, pending_path)
+        self._open()
+
+    def rotate_by_copy(self):
+        '''
+        Rotate the file that is written by someone else (e.g. an OS process) if it has exceeded max_bytes:
+        its contents are copied to the first rotated file and the file itself is truncated.
+        Data written in between copying and truncation is lost.
+        '''
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if not self.max_bytes or size <= self.max_bytes:
+            return
+        if self.backup_count > 0 and self.compressor is None:
+            self.shift_backups()
+            shutil.copyfile(self.path, self.backup_path(1))
+        elif self.backup_count > 0:
+            pending_path = self.compressor.pending_path(self.path)
+            shutil.copyfile(self.path, pending_path)
+            self.compressor.send(self, pending_path)
+        with open(self.path, 'r+b') as f:
+            f.truncate()
+
+    def flush(self):
+        '''
+        Flush the buffered data to the OS.
+        '''
+        if self._file is not None:
+            self._file.flush()
+            self._index.flush()
+
+    def close(self):
+        '''
+        Close the file.
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._index.close()
+            self._index = None
+
+    def _open(self):
+        self._file = open(self.path, 'ab', FILE_BUFFER_SIZE)
+        self._index = open(index_path(self.path), 'ab')
+        self.size = self._file.tell()
+        # The first line of the file is always indexed
+        self._indexed_epoch = None
+
+    def shift_backups(self):
+        '''
+        Shift the rotated files making room for the new first one. The oldest one is overwritten.
+        '''
+        for i in range(self.backup_count - 1, 0, -1):
+            src = self.backup_path(i)
+            if os.path.exists(src):
+                _move_segment(src, self.backup_path(i + 1))
+
+
+def _move_segment(src, dst):
+    os.rename(src, dst)
+    _move_index(src, dst)
+
+
+def _move_index(src, dst):
+    # The index is removed if there's no dst. An index left at dst belongs to another file, so it's removed too.
+    src_index = index_path(src)
+    if dst is None:
+        if os.path.exists(src_index):
+            os.remove(src_index)
+    elif os.path.exists(src_index):
+        os.rename(src_index, index_path(dst))
+    elif os.path.exists(index_path(dst)):
+        os.remove(index_path(dst))
+
+
+class Compressor(object):
+    '''
+    Compresses rotated log files with gzip or lzma from its own thread, so that rotation never stalls writing.
+    '''
+    def __init__(self, compression, level=6):
+        if not compression_available(compression):
+            raise ValueError('%s compression is not supported by this Python version' % compression)
+        self.name = 'local_compose_log_compressor'
+        self.compression = compression
+        self.level = level
+        self.suffix = COMPRESSION_SUFFIXES[compression]
+        self._ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def pending_path(self, path):
+        '''
+        Unique path the rotated file can be moved to while it waits to be compressed.
+        '''
+        return '%s.rotated-%d' % (path, next(self._ids))
+
+    def send(self, log_file, pending_path):
+        '''
+        Schedule compression of the file at pending_path into the first rotated file of log_file.
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(name=self.name, target=self._loop)
+            self._thread.daemon = True
+            self._thread.start()
+        self._queue.put((log_file, pending_path))
+
+    def close(self):
+        '''
+        Compress everything that has been sent.
+        '''
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def compress(self, src, dst):
+        '''
+        Compress the file at src into a new file at dst.
+        '''
+        tmp = dst + '.tmp'
+        with open(src, 'rb') as f_in:
+            with self._open(tmp) as f_out:
+                shutil.copyfileobj(f_in, f_out, FILE_BUFFER_SIZE)
+        os.rename(tmp, dst)
+
+    def _open(self, path):
+        if self.compression == COMPRESSION_LZMA:
+            import lzma
+            return lzma.open(path, 'wb', preset=self.level)
+        return gzip.open(path, 'wb', compresslevel=self.level)
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            log_file, pending_path = job
+            try:
+                log_file.shift_backups()
+                self.compress(pending_path, log_file.backup_path(1))
+                os.remove(pending_path)
+                _move_index(pending_path, log_file.backup_path(1))
+            except Exception as e:
+                # The rotated file is left as is, the following ones still get compressed
+                report_error('compression of %s has failed' % pending_path, e)
+
+
+class LogFilesWriter(object):
+    '''
+    Writes batches of output lines into the services' log files from its own thread,
+    so that disk I/O never blocks the terminal output.
+    Also rotates the watched files that are written directly by the services every check_interval seconds.
+    After the first I/O error the error is reported and the writer stops writing anything.
+    '''
+    def __init__(self, files, check_interval=1):
+        self.name = 'local_compose_log_files_writer'
+        self.check_interval = check_interval
+        self.failed = False
+        self._files = files
+        self._watched = []
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def watch(self, log_file):
+        '''
+        Rotate the log file that is written directly by a service.
+        '''
+        if self.failed:
+            return
+        self._queue.put(log_file)
+        self._launch()
+
+    def send(self, batch):
+        '''
+        Schedule writing of the batch: a dict of service name -> (list of encoded lines, marks).
+        See LogFile.write_lines for marks.
+        '''
+        if self.failed:
+            return
+        self._queue.put(batch)
+        self._launch()
+
+    def close(self):
+        '''
+        Write everything that has been sent and close the files.
+        '''
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _launch(self):
+        if self._thread is None:
+            self._thread = threading.Thread(name=self.name, target=self._loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _loop(self):
+        written = set()
+        check_at = None
+        while True:
+            if check_at is not None and monotonic() >= check_at:
+                self._safely(self._rotate_watched)
+                check_at = None if self.failed else monotonic() + self.check_interval
+            try:
+                batch = self._queue.get(timeout=None if check_at is None else max(check_at - monotonic(), 0))
+            except queue.Empty:
+                continue
+            if batch is None:
+                break
+            # What has been queued before the failure is dropped
+            if self.failed:
+                continue
+            if isinstance(batch, LogFile):
+                self._watched.append(batch)
+                if check_at is None:
+                    check_at = monotonic() + self.check_interval
+                continue
+            self._safely(self._write, batch, written)
+            # Make data visible to readers once there's nothing more to write for now
+            if self._queue.empty():
+                self._safely(self._flush, written)
+                written = set()
+        for f in self._files.values():
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+
+    def _safely(self, func, *args):
+        if self.failed:
+            return
+        try:
+            func(*args)
+        except (IOError, OSError) as e:
+            self.failed = True
+            report_error('writing of log files has stopped', e)
+
+    def _rotate_watched(self):
+        for f in self._watched:
+            f.rotate_by_copy()
+
+    def _write(self, batch, written):
+        for name, (lines, marks) in batch.items():
+            self._files[name].write_lines(lines, marks)
+            written.add(name)
+
+    def _flush(self, written):
+        for name in written:
+            self._files[name].flush()
@@ -0,0 +1,477 @@
+'''
+Reading of the services' log files written by RotatingFileLogWriter.
+'''
+import bisect
+import collections
+import datetime
+import heapq
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+
+from .logfiles import INDEX_ENTRY, COMPRESSION_SUFFIXES, index_path, open_segment
+
+
+# How many bytes to read from a log file at once
+READ_BLOCK_SIZE = 64 * 1024
+
+# Waiting for the log file changes can't be interrupted by signals on Python 2, so it's done in steps there
+FOLLOW_WAIT_TIMEOUT = 1 if sys.version_info[0] == 2 else None
+
+# Accepted formats of the time bounds and the period each of them denotes
+TIME_FORMATS = [
+    ('%H:%M', datetime.timedelta(minutes=1)),
+    ('%H:%M:%S', datetime.timedelta(seconds=1)),
+    ('%Y-%m-%d', datetime.timedelta(days=1)),
+    ('%Y-%m-%d %H:%M', datetime.timedelta(minutes=1)),
+    ('%Y-%m-%d %H:%M:%S', datetime.timedelta(seconds=1)),
+    ('%Y-%m-%dT%H:%M:%S', datetime.timedelta(seconds=1)),
+]
+
+
+def parse_time(value, today=None):
+    '''
+    Parse the time given by user into the (start, end) epoch seconds of the period it denotes.
+    E.g. '10:32' is [10:32:00, 10:33:00) of today.
+    '''
+    for fmt, period in TIME_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if '%Y' not in fmt:
+            parsed = datetime.datetime.combine(today or datetime.date.today(), parsed.time())
+        return int(time.mktime(parsed.timetuple())), int(time.mktime((parsed + period).timetuple()))
+    raise ValueError('unknown time format "%s"' % value)
+
+
+class _Index(object):
+    '''
+    Sequence of the entries of a time index file. Entries are read on demand, so the index can be bisected.
+    '''
+    def __init__(self, f):
+        self._f = f
+        f.seek(0, os.SEEK_END)
+        self._len = f.tell() // INDEX_ENTRY.size
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        self._f.seek(i * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(self._f.read(INDEX_ENTRY.size))
+
+
+class ServiceLog(object):
+    '''
+    Output of a service stored in its log file and the rotated (possibly compressed) ones.
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def segments(self):
+        '''
+        Paths of the existing log files from the oldest to the newest.
+        '''
+        rotated = []
+        number = 1
+        while True:
+            found = [p for p in self._rotated_paths(number) if os.path.exists(p)]
+            if not found:
+                break
+            rotated.append(found[0])
+            number += 1
+        rotated.reverse()
+        # Rotated files waiting to be compressed are newer than the compressed ones
+        pending = self._pending_paths()
+        current = [self.path] if os.path.exists(self.path) else []
+        return rotated + pending + current
+
+    def read(self, since=None, until=None):
+        '''
+        Yield blocks of the service output.
+        since, until - epoch seconds: only the lines output in [since, until) are read.
+        Time bounds are looked up in the time index of each file, files without an index are skipped then.
+        '''
+        for path in self.segments():
+            start, end = 0, None
+            if since is not None or until is not None:
+                bounds = self._locate(path, since, until)
+                if bounds is None:
+                    continue
+                start, end = bounds
+            for block in self._read(path, start, end):
+                yield block
+
+    def lines(self, since=None, until=None):
+        '''
+        Yield (epoch second the line was output at, line) for each line of the service output.
+        The epoch is None for the lines that were output before any time has been recorded in the time index.
+        since, until - the same as for read().
+        '''
+        epoch = None
+        for path in self.segments():
+            start, end = 0, None
+            if since is not None or until is not None:
+                bounds = self._locate(path, since, until)
+                if bounds is None:
+                    continue
+                start, end = bounds
+            entries = _index_entries(path)
+            entry = next(entries, None)
+            offset = start
+            with open_segment(path) as f:
+                f.seek(start)
+                for line in f:
+                    if end is not None and offset >= end:
+                        break
+                    while entry is not None and entry[1] <= offset:
+                        epoch = entry[0]
+                        entry = next(entries, None)
+                    yield epoch, line
+                    offset += len(line)
+
+    def tail(self, count):
+        '''
+        Yield blocks of the last count lines of the service output.
+        Files are read from the newest one back, only as many of them as needed.
+        Plain files are read backwards from the end in blocks, so only the needed part of them is read.
+        '''
+        parts = []
+        for path in reversed(self.segments()):
+            if count <= 0:
+                break
+            data, found = self._tail(path, count)
+            parts.append(data)
+            count -= found
+        for data in reversed(parts):
+            if data:
+                yield data
+
+    def _pending_paths(self):
+        directory, name = os.path.split(self.path)
+        try:
+            names = os.listdir(directory or '.')
+        except OSError:
+            return []
+        prefix = name + '.rotated-'
+        pending = [n for n in names if n.startswith(prefix) and not n.endswith('.idx')]
+        pending.sort(key=lambda n: int(n[len(prefix):]))
+        return [os.path.join(directory, n) for n in pending]
+
+    def _rotated_paths(self, number):
+        path = '%s.%d' % (self.path, number)
+        return [path] + [path + suffix for suffix in sorted(COMPRESSION_SUFFIXES.values())]
+
+    @staticmethod
+    def _locate(path, since, until):
+        try:
+            f = open(index_path(path), 'rb')
+        except IOError:
+            return None
+        with f:
+            index = _Index(f)
+            if len(index) == 0:
+                return None
+            start, end = 0, None
+            if since is not None:
+                i = bisect.bisect_left(index, (since, 0))
+                if i == len(index):
+                    return None
+                start = index[i][1]
+            if until is not None:
+                i = bisect.bisect_left(index, (until, 0))
+                if i < len(index):
+                    end = index[i][1]
+        if end is not None and end <= start:
+            return None
+        return start, end
+
+    @staticmethod
+    def _tail(path, count):
+        if path.endswith(tuple(COMPRESSION_SUFFIXES.values())):
+            # Compressed files can't be read backwards
+            with open_segment(path) as f:
+                lines = collections.deque(f, maxlen=count)
+            return b''.join(lines), len(lines)
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            return _tail_file(f, f.tell(), count)
+
+    @staticmethod
+    def _read(path, start, end):
+        with open_segment(path) as f:
+            f.seek(start)
+            left = None if end is None else end - start
+            while left is None or left > 0:
+                block = f.read(READ_BLOCK_SIZE if left is None else min(READ_BLOCK_SIZE, left))
+                if not block:
+                    break
+                if left is not None:
+                    left -= len(block)
+                yield block
+
+
+def merge(service_logs, since=None, until=None):
+    '''
+    Yield lines of the output of several services ordered by time.
+    service_logs - list of ServiceLog. Their lines are merged lazily, so only one line of each service is kept
+    in memory at a time. Time is known up to a second, lines output in the same second are ordered as the services.
+    '''
+    streams = [_keyed_lines(number, service_log.lines(since, until)) for number, service_log in enumerate(service_logs)]
+    for _, _, _, line in heapq.merge(*streams):
+        yield line
+
+
+def _keyed_lines(number, lines):
+    for i, (epoch, line) in enumerate(lines):
+        yield (-1 if epoch is None else epoch), number, i, line
+
+
+def _index_entries(path):
+    '''
+    Yield entries of the time index of the log file one by one.
+    '''
+    try:
+        f = open(index_path(path), 'rb')
+    except IOError:
+        return
+    with f:
+        while True:
+            data = f.read(INDEX_ENTRY.size * 1024)
+            if len(data) < INDEX_ENTRY.size:
+                break
+            for i in range(0, len(data) - len(data) % INDEX_ENTRY.size, INDEX_ENTRY.size):
+                yield INDEX_ENTRY.unpack_from(data, i)
+
+
+def grep(service_logs, pattern, processes=None):
+    '''
+    Search the logs of the services for the lines matching the regular expression (bytes).
+    service_logs - list of (service name, ServiceLog).
+    Yields (service name, epoch second the line was output at or None if unknown, line) for each matching line.
+    Files are memory-mapped and searched in parallel by a pool of processes (regex search holds the GIL,
+    so threads wouldn't run in parallel).
+    '''
+    jobs = [(name, path) for name, service_log in service_logs for path in service_log.segments()]
+    args = [(path, pattern) for _, path in jobs]
+    pool = None
+    if len(jobs) > 1 and processes != 1:
+        pool = multiprocessing.Pool(processes or min(multiprocessing.cpu_count(), len(jobs)))
+        results = pool.imap(_grep_file, args)
+    else:
+        results = (_grep_file(a) for a in args)
+    try:
+        for i, matches in enumerate(results):
+            name = jobs[i][0]
+            for epoch, line in matches:
+                yield name, epoch, line
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def _grep_file(args):
+    path, pattern = args
+    regex = re.compile(pattern, re.MULTILINE)
+    if path.endswith(tuple(COMPRESSION_SUFFIXES.values())):
+        with open_segment(path) as f:
+            found = _grep_data(regex, f.read())
+    else:
+        with open(path, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                return []
+            try:
+                found = _grep_data(regex, data)
+            finally:
+                data.close()
+    if not found:
+        return []
+    epochs, offsets = _read_index(path)
+    matches = []
+    for offset, line in found:
+        i = bisect.bisect_right(offsets, offset) - 1
+        matches.append((epochs[i] if i >= 0 else None, line))
+    return matches
+
+
+def _grep_data(regex, data):
+    '''
+    Get (offset, line) of each line of data the regex matches in.
+    '''
+    found = []
+    pos = 0
+    while True:
+        m = regex.search(data, pos)
+        if m is None:
+            break
+        start = data.rfind(b'\n', 0, m.start()) + 1
+        end = data.find(b'\n', m.end())
+        if end < 0:
+            end = len(data)
+        found.append((start, data[start:end]))
+        pos = end + 1
+        if pos >= len(data):
+            break
+    return found
+
+
+def _read_index(path):
+    '''
+    Read the whole time index of the log file into lists of epochs and offsets.
+    '''
+    epochs = []
+    offsets = []
+    try:
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+    except IOError:
+        return epochs, offsets
+    for i in range(0, len(data) - len(data) % INDEX_ENTRY.size, INDEX_ENTRY.size):
+        epoch, offset = INDEX_ENTRY.unpack_from(data, i)
+        epochs.append(epoch)
+        offsets.append(offset)
+    return epochs, offsets
+
+
+class LogFollower(object):
+    '''
+    Follows the log file of a service: yields the output appended to it, including after the file is rotated.
+    Waits for the changes of the file with the OS file system events (e.g. inotify on Linux), not by polling.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._changed = threading.Event()
+        self._stopped = False
+
+    def stop(self):
+        '''
+        Stop following. Safe to call from other threads.
+        '''
+        self._stopped = True
+        self._changed.set()
+
+    def blocks(self):
+        '''
+        Yield blocks of the output appended to the log file since the call.
+        '''
+        # watchdog is needed only for following, so it's imported on demand
+        from watchdog.observers import Observer
+        observer = Observer()
+        observer.schedule(_ChangeHandler(self.path, self._changed), os.path.dirname(os.path.abspath(self.path)))
+        observer.start()
+        f = self._open(at_end=True)
+        try:
+            while not self._stopped:
+                self._changed.clear()
+                if f is None:
+                    f = self._open()
+                else:
+                    for block in self._read_available(f):
+                        yield block
+                    f = self._reopen_if_rotated(f)
+                if f is not None and self._has_more(f):
+                    continue
+                self._changed.wait(FOLLOW_WAIT_TIMEOUT)
+        finally:
+            observer.stop()
+            observer.join()
+            if f is not None:
+                f.close()
+
+    def _open(self, at_end=False):
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return None
+        if at_end:
+            f.seek(0, os.SEEK_END)
+        return f
+
+    def _reopen_if_rotated(self, f):
+        try:
+            current = os.stat(self.path)
+        except OSError:
+            current = None
+        stat = os.fstat(f.fileno())
+        if current is not None and current.st_ino == stat.st_ino:
+            # The file has been truncated (copy-truncate rotation)
+            if stat.st_size < f.tell():
+                f.seek(0)
+            return f
+        # The file has been moved away or removed: it's already read till the end, its successor is read next
+        f.close()
+        return self._open()
+
+    @staticmethod
+    def _has_more(f):
+        return os.fstat(f.fileno()).st_size > f.tell()
+
+    @staticmethod
+    def _read_available(f):
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+
+
+class _ChangeHandler(object):
+    '''
+    Handler of the file system events that signals about changes of a specific file.
+    '''
+    def __init__(self, path, changed):
+        self._path = os.path.abspath(path)
+        self._changed = changed
+
+    def dispatch(self, event):
+        paths = [event.src_path, getattr(event, 'dest_path', None)]
+        if any(p is not None and os.path.abspath(_to_str(p)) == self._path for p in paths):
+            self._changed.set()
+
+
+def _to_str(path):
+    if isinstance(path, bytes):
+        return path.decode('utf-8', 'replace')
+    return path
+
+
+def _tail_file(f, size, count):
+    '''
+    Read the last count lines of the file backwards in blocks.
+    Returns them and how many lines were found.
+    '''
+    blocks = []
+    breaks = 0
+    start = None
+    pos = size
+    limit = size
+    while pos > 0 and start is None:
+        read = min(READ_BLOCK_SIZE, pos)
+        pos -= read
+        f.seek(pos)
+        block = f.read(read)
+        if not blocks and block.endswith(b'\n'):
+            # Line break at the very end of the file doesn't start a new line
+            limit = size - 1
+        blocks.append(block)
+        i = min(len(block), limit - pos)
+        while True:
+            i = block.rfind(b'\n', 0, i)
+            if i < 0:
+                break
+            breaks += 1
+            if breaks == count:
+                start = i + 1
+                break
+    data = b''.join(reversed(blocks))
+    if start is None:
+        return data, breaks + 1 if size else 0
+    return data[start:], count
@@ -1,8 +1,7 @@
 from abc import ABCMeta
-try:
-    import queue
-except ImportError:
-    import Queue as queue
+import collections
+import threading
+import time
 
 from .utils import now
 
@@ -10,6 +9,14 @@ from .utils import now
 # Name that is used for system-wide messages output
 SYSTEM_LABEL = 'system'
 
+# What to do with service output when its buffer limit is exceeded:
+# pause reading the service output until the buffered lines are consumed
+OVERFLOW_BLOCK = 'block'
+# drop the oldest buffered lines of the service
+OVERFLOW_DROP_OLDEST = 'dropOldest'
+# drop the new lines and put a marker with the number of the dropped lines instead
+OVERFLOW_COALESCE = 'coalesce'
+
 
 class Message(object):
     '''
@@ -31,7 +38,15 @@ class Message(object):
 class Line(Message):
     '''
     Message type for Service and system information logging and output.
+    Data can hold several lines at once.
     '''
+    def text(self):
+        '''
+        Get data as text. Unrecognizable bytes are replaced with Unicode replacement character (U+FFFD).
+        '''
+        if isinstance(self.data, bytes):
+            return self.data.decode('utf-8', 'replace')
+        return self.data
 
 
 class Start(Message):
@@ -61,28 +76,168 @@ class EmptyBus(Message):
 class EventBus():
     '''
     Main event messaging bus for the runtime.
+    Messages can be sent and received in batches: the lock is acquired once per batch.
+    Output of every service can be bounded by max_lines lines waiting in the bus,
+    overflow sets the policy applied when the limit is exceeded.
+    on_capacity - is called when a blocked service can send its output again.
     '''
-    def __init__(self):
-        self._bus = queue.Queue()
+    def __init__(self, max_lines=None, overflow=OVERFLOW_BLOCK, on_capacity=None):
+        self._bus = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+        self._max_lines = max_lines
+        self._overflow = overflow
+        self._on_capacity = on_capacity
+        # Per service: number of buffered lines, buffered Line messages, lines that were dropped
+        self._lines = collections.defaultdict(int)
+        self._buffered = collections.defaultdict(collections.deque)
+        self._dropped = collections.defaultdict(int)
+        # Lines dropped since the last coalesce marker and the color to print the marker with
+        self._coalesced = {}
+        self._colors = {}
+        self._discarded = set()
+        self._blocked = set()
 
     def receive(self, timeout=0.1):
         '''
         Receive a message from this event bus.
         '''
-        try:
-            return self._bus.get(timeout=timeout)
-        except queue.Empty:
-            return EmptyBus(data='No messages in queue', name=SYSTEM_LABEL)
+        messages = self.receive_many(1, timeout=timeout)
+        if messages:
+            return messages[0]
+        return EmptyBus(data='No messages in queue', name=SYSTEM_LABEL)
+
+    def receive_many(self, max_items=None, timeout=0.1):
+        '''
+        Receive all the queued messages (but no more than max_items) from this event bus.
+        Waits up to timeout seconds (or forever if timeout is None) for at least one message to arrive.
+        Returns empty list if there are no messages.
+        '''
+        with self._cond:
+            self._flush_coalesced()
+            if timeout is None:
+                while not self._bus:
+                    self._cond.wait()
+            elif not self._bus:
+                deadline = time.time() + timeout
+                while not self._bus:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return []
+                    self._cond.wait(remaining)
+            messages = []
+            while self._bus and (max_items is None or len(messages) < max_items):
+                msg = self._bus.popleft()
+                if self._is_limited(msg):
+                    if id(msg) in self._discarded:
+                        self._discarded.remove(id(msg))
+                        continue
+                    self._release(msg)
+                messages.append(msg)
+            unblocked = self._unblock()
+        if unblocked and self._on_capacity is not None:
+            self._on_capacity()
+        return messages
 
     def send(self, message):
         '''
         Send a message to this event bus.
         '''
-        self._bus.put(message)
+        with self._cond:
+            self._put(message)
+            self._cond.notify()
+
+    def send_many(self, messages):
+        '''
+        Send several messages to this event bus at once.
+        '''
+        with self._cond:
+            for message in messages:
+                self._put(message)
+            self._cond.notify()
 
     def send_system(self, data, message_class=Line):
         '''
         Send a system-type message to this event bus.
         message_class - represents class of the message you want to send.
         '''
-        self._bus.put(message_class(data=data, name=SYSTEM_LABEL))
+        self.send(message_class(data=data, name=SYSTEM_LABEL))
+
+    def has_capacity(self, name):
+        '''
+        Can the service send more output without exceeding its limit?
+        Always true unless the overflow policy is to block.
+        '''
+        if self._max_lines is None or self._overflow != OVERFLOW_BLOCK:
+            return True
+        with self._cond:
+            if self._lines[name] < self._max_lines:
+                return True
+            self._blocked.add(name)
+            return False
+
+    def dropped_lines(self):
+        '''
+        Get number of the dropped output lines per service.
+        '''
+        with self._cond:
+            return dict(self._dropped)
+
+    def _is_limited(self, message):
+        return self._max_lines is not None and isinstance(message, Line) and message.name != SYSTEM_LABEL
+
+    def _put(self, message):
+        if not self._is_limited(message):
+            self._bus.append(message)
+            return
+        name = message.name
+        count = _count_lines(message.data)
+        # A batch is always accepted if nothing of the service is buffered, even if it exceeds the limit
+        if self._lines[name] and self._lines[name] + count > self._max_lines:
+            if self._overflow == OVERFLOW_COALESCE:
+                self._dropped[name] += count
+                self._coalesced[name] = self._coalesced.get(name, 0) + count
+                self._colors[name] = message.color
+                return
+            if self._overflow == OVERFLOW_DROP_OLDEST:
+                self._drop_oldest(name, self._lines[name] + count - self._max_lines)
+        if name in self._coalesced:
+            self._put_coalesced_marker(name)
+        self._buffer(message, count)
+
+    def _buffer(self, message, count):
+        self._lines[message.name] += count
+        self._buffered[message.name].append((message, count))
+        self._bus.append(message)
+
+    def _release(self, message):
+        _, count = self._buffered[message.name].popleft()
+        self._lines[message.name] -= count
+
+    def _drop_oldest(self, name, excess):
+        buffered = self._buffered[name]
+        while excess > 0 and buffered:
+            message, count = buffered.popleft()
+            self._discarded.add(id(message))
+            self._lines[name] -= count
+            self._dropped[name] += count
+            excess -= count
+
+    def _put_coalesced_marker(self, name):
+        data = '... %d lines dropped ...\n' % self._coalesced.pop(name)
+        self._buffer(Line(data=data, name=name, color=self._colors.pop(name)), 1)
+
+    def _flush_coalesced(self):
+        for name in list(self._coalesced):
+            if self._lines[name] < self._max_lines:
+                self._put_coalesced_marker(name)
+
+    def _unblock(self):
+        unblocked = [name for name in self._blocked if self._lines[name] < self._max_lines]
+        for name in unblocked:
+            self._blocked.remove(name)
+        return bool(unblocked)
+
+
+def _count_lines(data):
+    newline = b'\n' if isinstance(data, bytes) else '\n'
+    return max(1, data.count(newline))
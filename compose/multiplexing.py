@@ -0,0 +1,193 @@
+import os
+import select
+import threading
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+
+# How many bytes to read from a service pipe at once
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class _SelectSelector(object):
+    '''
+    Minimal `select.select` based replacement for the `selectors` module on interpreters that lack it.
+    Only the subset of the API used by OutputMultiplexer is supported.
+    '''
+    def __init__(self):
+        self._fds = {}
+
+    def register(self, fd, _events, data=None):
+        self._fds[fd] = data
+
+    def unregister(self, fd):
+        del self._fds[fd]
+
+    def select(self, timeout=None):
+        readable, _, _ = select.select(list(self._fds), [], [], timeout)
+        return [(_Key(fd, self._fds[fd]), None) for fd in readable]
+
+
+class _Key(object):
+    def __init__(self, fd, data):
+        self.fd = fd
+        self.data = data
+
+
+def split_lines(carry, chunk):
+    '''
+    Split freshly read chunk of output at its last line break.
+    Returns all the complete lines as a single batch and the trailing incomplete line
+    that must be carried over to the next chunk.
+    An incomplete line that has grown longer than READ_CHUNK_SIZE is returned as is.
+    '''
+    end = chunk.rfind(b'\n') + 1
+    if end == 0:
+        carry += chunk
+        if len(carry) >= READ_CHUNK_SIZE:
+            return carry, b''
+        return b'', carry
+    if end == len(chunk):
+        return carry + chunk if carry else chunk, b''
+    return carry + chunk[:end], chunk[end:]
+
+
+def _new_selector():
+    if selectors is None:
+        return _SelectSelector()
+    return selectors.DefaultSelector()
+
+
+def _event_read():
+    if selectors is None:
+        return None
+    return selectors.EVENT_READ
+
+
+class _Source(object):
+    '''
+    State of a single child process output being multiplexed.
+    '''
+    def __init__(self, child, on_output, on_exit, has_capacity):
+        self.child = child
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.has_capacity = has_capacity
+        self.carry = b''
+
+
+class OutputMultiplexer(object):
+    '''
+    Drains stdout pipes of all the running services from a single thread.
+    Uses the best selector available on the host OS (e.g. epoll on Linux).
+    Thread count therefore doesn't depend on the number of services.
+    '''
+    def __init__(self, reap_interval_sec=0.1):
+        self.name = 'local_compose_multiplexer'
+        self._reap_interval_sec = reap_interval_sec
+        self._selector = _new_selector()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._paused = []
+        self._reaping = []
+        self._stop = False
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._selector.register(self._wakeup_r, _event_read(), None)
+
+    def launch(self):
+        '''
+        Start multiplexing.
+        '''
+        th = threading.Thread(name=self.name, target=self.loop)
+        th.daemon = True
+        th.start()
+
+    def stop(self):
+        '''
+        Stop multiplexing.
+        '''
+        self._stop = True
+        self._wakeup()
+
+    def add(self, child, on_output, on_exit, has_capacity=None):
+        '''
+        Start watching output of the child process.
+        on_output - is called with every batch of complete lines the child writes to its stdout.
+        on_exit - is called with the child's return code once it has exited.
+        has_capacity - is called after each batch, if it returns False reading of the child output is paused
+        (and thus the child's pipe backs up) till the next call of resume().
+        '''
+        with self._lock:
+            self._pending.append(_Source(child, on_output, on_exit, has_capacity))
+        self._wakeup()
+
+    def resume(self):
+        '''
+        Resume reading output of the paused children that have capacity for it.
+        '''
+        self._wakeup()
+
+    def loop(self):
+        '''
+        The actual multiplexing method.
+        '''
+        while not self._stop:
+            self._register_pending()
+            self._resume_paused()
+            timeout = self._reap_interval_sec if self._reaping else None
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    os.read(self._wakeup_r, READ_CHUNK_SIZE)
+                else:
+                    self._drain(key.fd, key.data)
+            self._reap()
+
+    def _wakeup(self):
+        os.write(self._wakeup_w, b'.')
+
+    def _register_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for source in pending:
+            if source.child.stdout is None:
+                self._reaping.append(source)
+            else:
+                self._selector.register(source.child.stdout.fileno(), _event_read(), source)
+
+    def _drain(self, fd, source):
+        chunk = os.read(fd, READ_CHUNK_SIZE)
+        if not chunk:
+            if source.carry:
+                source.on_output(source.carry)
+            self._selector.unregister(fd)
+            source.child.stdout.close()
+            self._reaping.append(source)
+            return
+        lines, source.carry = split_lines(source.carry, chunk)
+        if lines:
+            source.on_output(lines)
+        if source.has_capacity is not None and not source.has_capacity():
+            self._selector.unregister(fd)
+            self._paused.append(source)
+
+    def _resume_paused(self):
+        if not self._paused:
+            return
+        still_paused = []
+        for source in self._paused:
+            if source.has_capacity():
+                self._selector.register(source.child.stdout.fileno(), _event_read(), source)
+            else:
+                still_paused.append(source)
+        self._paused = still_paused
+
+    def _reap(self):
+        still_running = []
+        for source in self._reaping:
+            if source.child.poll() is None:
+                still_running.append(source)
+            else:
+                source.on_exit(source.child.returncode)
+        self._reaping = still_running
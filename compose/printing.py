@@ -1,12 +1,16 @@
-from __future__ import print_function
-import os
-import logging
-import logging.handlers
+import sys
+import datetime
+from json.encoder import encode_basestring_ascii
+from time import mktime
 
-import colored
-
-from .info import NAME
+from .logfiles import LogFile, LogFilesWriter, Compressor, log_file_path, COMPRESSION_NONE
 from .messaging import Line, SYSTEM_LABEL
+from .utils import monotonic
+
+
+# Formats of the output in console
+FORMAT_TEXT = 'text'
+FORMAT_JSON = 'json'
 
 
 class WritersFactory(object):
@@ -23,10 +27,13 @@ class WritersFactory(object):
         Create writers
         '''
         writers = []
-        if self.use_color:
-            stdout_writer = ColoredPrintWriter()
+        binary = self.conf.logging.get('binary', False)
+        if self.conf.logging.get('format', FORMAT_TEXT) == FORMAT_JSON:
+            stdout_writer = JsonLinesWriter(buffered=True, binary=binary)
+        elif self.use_color:
+            stdout_writer = ColoredPrintWriter(buffered=True, binary=binary)
         else:
-            stdout_writer = SimplePrintWriter()
+            stdout_writer = SimplePrintWriter(buffered=True, binary=binary)
         if self.conf.logging.get('toStdout', True):
             writers.append(stdout_writer)
         to_file_config = self.conf.logging.get('toFile')
@@ -35,79 +42,296 @@ class WritersFactory(object):
                 self.store_temp_dir,
                 self.conf.services,
                 to_file_config.get('maxSize', 0),
-                to_file_config.get('backupCount', 0),
+                int(to_file_config.get('count', 0)),
+                compression=to_file_config.get('compression', COMPRESSION_NONE),
+                compression_level=to_file_config.get('compressionLevel', 6),
             )
             writers.append(file_writer)
         return writers
 
+    def redirect_output(self, service):
+        '''
+        Make the service write its output directly to its log file if the output goes nowhere else.
+        '''
+        to_file_config = self.conf.logging.get('toFile')
+        if self.conf.logging.get('toStdout', True) or not (to_file_config and to_file_config.get('enabled')):
+            return
+        service.output_file = log_file_path(self.store_temp_dir, service)
+
 
 class RotatingFileLogWriter(object):
     '''
     Writer that writes data into the log files of a specified size, that are rotating when size exceeds.
+    Lines are collected into per-service batches that are written by a dedicated thread.
+    Rotated files are compressed in the background if compression is set.
+    Time of the messages is recorded into the time index of the files.
     '''
-    def __init__(self, store_temp_dir, services, max_bytes, backup_count):
-        self._loggers = {}
+    # Messages are written with the time and service name prefix
+    use_prefix = True
+
+    def __init__(self, store_temp_dir, services, max_bytes, backup_count, batch_lines=1024,
+                 compression=COMPRESSION_NONE, compression_level=6):
+        self._batch_lines = batch_lines
+        self._compressor = None
+        if compression != COMPRESSION_NONE:
+            self._compressor = Compressor(compression, compression_level)
+        self._files = {}
         for s in services:
-            if s.log_to_file:
-                file_path = s.log_to_file
-            else:
-                file_path = os.path.join(store_temp_dir, '%s.log' % s.name)
-            handler = logging.handlers.RotatingFileHandler(file_path, maxBytes=max_bytes, backupCount=backup_count)
-            logger = logging.getLogger('%s-%s' % (NAME, s.name))
-            logger.setLevel(logging.INFO)
-            logger.addHandler(handler)
-            self._loggers[s] = logger
-
-    def write(self, message, color=None, service=None):
+            self._files[s.name] = LogFile(log_file_path(store_temp_dir, s), max_bytes=max_bytes,
+                                          backup_count=backup_count, compressor=self._compressor)
+        self._writer = LogFilesWriter(self._files)
+        self._batch = {}
+        self._batch_size = 0
+        # Epoch second of the last line of each service
+        self._epochs = {}
+        self._last_time = None
+        self._last_epoch = None
+
+    def register(self, service):
+        '''
+        Prepare for writing output of the service
+        '''
+        log_file = self._files.get(service.name)
+        # Output written by the service directly is only to be rotated
+        if log_file is not None and service.output_file is not None and log_file.max_bytes:
+            self._writer.watch(log_file)
+
+    def write(self, message, color=None, service=None, time=None):
         '''
         Write a message
         '''
-        if service in self._loggers:
-            self._loggers[service].info(message)
+        if service not in self._files:
+            return
+        batch = self._batch.get(service)
+        if batch is None:
+            batch = self._batch[service] = ([], {})
+        lines, marks = batch
+        if time is not None:
+            # All the lines of a multi-line message share the same time object
+            if time is not self._last_time:
+                self._last_time = time
+                self._last_epoch = int(mktime(time.timetuple()))
+            if self._epochs.get(service) != self._last_epoch:
+                self._epochs[service] = self._last_epoch
+                marks[len(lines)] = self._last_epoch
+        if not isinstance(message, bytes):
+            message = message.encode('utf-8')
+        lines.append(message + b'\n')
+        self._batch_size += 1
+        if self._batch_size >= self._batch_lines:
+            self._send()
+
+    def idle(self):
+        '''
+        Notify that there is no more output for now
+        '''
+        self._send()
+
+    def close(self):
+        '''
+        Finish writing
+        '''
+        self._send()
+        self._writer.close()
+        if self._compressor is not None:
+            self._compressor.close()
+
+    def _send(self):
+        if self._batch:
+            self._writer.send(self._batch)
+            self._batch = {}
+            self._batch_size = 0
 
 
 class SimplePrintWriter(object):
     '''
-    Basic writer that uses `print` function.
+    Basic writer that writes to stdout.
     Doesn't use colors.
+    If buffered, output is accumulated and written to stdout when there's buffer_size of it,
+    when flush_interval seconds have passed since the last write or when there's no more output for now.
+    When stdout is not a TTY (e.g. it's piped) the output is written only when there's buffer_size of it.
+    If binary, messages are bytes and are written to the underlying binary stdout.
     '''
-    def write(self, message, color=None, service=None):
+    # Messages are written with the time and service name prefix
+    use_prefix = True
+
+    def __init__(self, buffered=False, buffer_size=64 * 1024, flush_interval=0.02, binary=False):
+        self.buffered = buffered
+        self.binary = binary
+        self._newline = b'\n' if binary else '\n'
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.block_buffered = buffered and not sys.stdout.isatty()
+        self._buffer = []
+        self._buffer_len = 0
+        self._flushed_at = monotonic()
+
+    def register(self, service):
+        '''
+        Prepare for writing output of the service
+        '''
+
+    def write(self, message, color=None, service=None, time=None):
         '''
         Write a message
         '''
-        print(message)
+        if not self.buffered:
+            self._stdout().write(message + self._newline)
+            return
+        self._buffer.append(message)
+        self._buffer.append(self._newline)
+        self._buffer_len += len(message) + 1
+        if self._buffer_len >= self.buffer_size:
+            self.flush()
+        elif not self.block_buffered and monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def idle(self):
+        '''
+        Notify that there is no more output for now
+        '''
+        if not self.block_buffered:
+            self.flush()
+
+    def close(self):
+        '''
+        Finish writing
+        '''
+        self.flush()
+
+    def flush(self):
+        '''
+        Write all the buffered output
+        '''
+        self._flushed_at = monotonic()
+        if not self._buffer:
+            return
+        data = self._newline[:0].join(self._buffer)
+        self._buffer = []
+        self._buffer_len = 0
+        out = self._stdout()
+        out.write(data)
+        out.flush()
+
+    def _stdout(self):
+        if self.binary:
+            # Python 2 stdout accepts bytes as is
+            return getattr(sys.stdout, 'buffer', sys.stdout)
+        return sys.stdout
 
 
 class ColoredPrintWriter(SimplePrintWriter):
     '''
     Writer that uses `colored` lib functionality.
     Can use 8-bit palette: 256 colors.
+    Each color is resolved into its escape sequences only once.
     '''
-    def write(self, message, color=None, service=None):
+    def __init__(self, *args, **kwargs):
+        super(ColoredPrintWriter, self).__init__(*args, **kwargs)
+        self._styles = {}
+
+    def register(self, service):
+        '''
+        Prepare for writing output of the service
+        '''
+        if service.color is not None:
+            self._style(service.color)
+
+    def write(self, message, color=None, service=None, time=None):
         '''
         Write a message
         '''
-        if color is None:
-            msg = message
-        else:
-            msg = colored.stylize(message, colored.fg(color))
-        super(ColoredPrintWriter, self).write(message=msg, color=color, service=service)
+        if color is not None:
+            style = self._styles.get(color)
+            if style is None:
+                style = self._style(color)
+            message = style[0] + message + style[1]
+        super(ColoredPrintWriter, self).write(message=message, color=color, service=service, time=time)
 
     @staticmethod
     def supported_colors():
         '''
         Get colors supported by the printer.
         '''
+        # colored is imported only when colors are really needed
+        import colored
         return colored.colors.names
 
+    def _style(self, color):
+        import colored
+        style = (colored.fg(color), colored.attr('reset'))
+        if self.binary:
+            style = (style[0].encode('ascii'), style[1].encode('ascii'))
+        self._styles[color] = style
+        return style
+
+
+class JsonLinesWriter(SimplePrintWriter):
+    '''
+    Writer that outputs each message as a JSON object on a separate line, e.g.:
+    {"service":"web","pid":42,"stream":"stdout","time":1547730073.100000,"message":"Hello"}
+    Stderr of the services is merged into their stdout. System messages have "system" stream and null pid.
+    Records are built from a template prepared once per service, only the time and the message are serialized
+    for each record.
+    '''
+    # Records have their own time and service name fields
+    use_prefix = False
+
+    def __init__(self, *args, **kwargs):
+        super(JsonLinesWriter, self).__init__(*args, **kwargs)
+        self._services = {}
+        self._templates = {}
+        self._last_time = None
+        self._last_time_json = 'null'
+
+    def register(self, service):
+        '''
+        Prepare for writing output of the service
+        '''
+        self._services[service.name] = service
+
+    def write(self, message, color=None, service=None, time=None):
+        '''
+        Write a message
+        '''
+        if isinstance(message, bytes):
+            message = message.decode('utf-8', 'replace')
+        if time is not self._last_time:
+            self._last_time = time
+            self._last_time_json = 'null' if time is None else \
+                '%d.%06d' % (mktime(time.timetuple()), time.microsecond)
+        record = self._template(service) + self._last_time_json + ',"message":' + \
+            encode_basestring_ascii(message) + '}'
+        if self.binary:
+            record = record.encode('ascii')
+        super(JsonLinesWriter, self).write(message=record, color=color, service=service, time=time)
+
+    def _template(self, name):
+        srv = self._services.get(name)
+        pid = None if srv is None else srv.pid
+        template = self._templates.get(name)
+        if template is None or template[0] != pid:
+            text = '{"service":%s,"pid":%s,"stream":%s,"time":' % (
+                encode_basestring_ascii(name or ''),
+                'null' if pid is None else int(pid),
+                '"stdout"' if srv is not None else '"system"',
+            )
+            template = self._templates[name] = (pid, text)
+        return template[1]
+
 
 class Printer(object):
     '''
     Prints messages. For this it uses a specific writer for this purpose.
     In general, it's a smart facade for a Writer.
+    Prefixes are cached: name segment per service and formatted time per second of wall clock.
+    If binary, service output is never decoded: lines and prefixes are passed to writers as bytes.
+    Writers that have use_prefix set to False always get lines without the prefix.
     '''
-    def __init__(self, writers, time_format=None, use_prefix=True):
+    def __init__(self, writers, time_format=None, use_prefix=True, binary=False):
         self.writers = writers
+        self._prefixed_writers = [w for w in writers if getattr(w, 'use_prefix', True)]
+        self._plain_writers = [w for w in writers if not getattr(w, 'use_prefix', True)]
         if time_format is None:
             # todo - take from schema
             self.time_format = '%H:%M:%S'
@@ -116,6 +340,13 @@ class Printer(object):
         # The only known 'service' name that we know for sure at the begining
         self.width = len(SYSTEM_LABEL)
         self.use_prefix = use_prefix
+        self.binary = binary
+        self._name_segments = {}
+        # Sub-second time formats can't be cached
+        self._cache_time = '%f' not in self.time_format
+        self._time_from = None
+        self._time_till = None
+        self._time_formatted = None
 
     def write(self, message):
         '''
@@ -124,34 +355,85 @@ class Printer(object):
         if not isinstance(message, Line):
             raise RuntimeError('Printer can only process messages of type "%s"' % Line.__name__)
 
-        if message.name is not None:
-            name = message.name
+        if self.binary:
+            data = message.data
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            lines = data.splitlines() or [b'']
         else:
-            name = ''
-        name = name.ljust(self.width)
-        if name:
-            name += ' '
-
-        # Replace the unrecognizable bytes with Unicode replacement character (U+FFFD).
-        if isinstance(message.data, bytes):
-            string_data = message.data.decode('utf-8', 'replace')
+            lines = message.text().splitlines() or ['']
+
+        name = message.name
+        color = message.color
+        time = message.time
+        writers = self._prefixed_writers
+        if self.use_prefix and writers:
+            prefix = self._format_time(time) + self._name_segment(name)
+            for line in lines:
+                prefixed = prefix + line
+                for w in writers:
+                    w.write(prefixed, color=color, service=name, time=time)
+            writers = self._plain_writers
         else:
-            string_data = message.data
+            writers = self.writers
+        for line in lines:
+            for w in writers:
+                w.write(line, color=color, service=name, time=time)
 
-        lines = string_data.splitlines()
-        if not lines:
-            lines = ['']
+    def register(self, service):
+        '''
+        Prepare for printing output of the service
+        '''
+        self.adjust_width(service)
+        for w in self.writers:
+            w.register(service)
 
-        for line in lines:
-            prefix = ''
-            if self.use_prefix:
-                time_formatted = message.time.strftime(self.time_format)
-                prefix = '{time} {name}| '.format(time=time_formatted, name=name)
-            for w in self.writers:
-                w.write(prefix + line, color=message.color, service=name)
+    def idle(self):
+        '''
+        Notify writers that there is no more output for now
+        '''
+        for w in self.writers:
+            w.idle()
+
+    def close(self):
+        '''
+        Finish writing: all the buffered output is written
+        '''
+        for w in self.writers:
+            w.close()
 
     def adjust_width(self, service):
         '''
         Sets maximal width for info column based on langest service name
         '''
-        self.width = max(self.width, len(service.name))
+        width = max(self.width, len(service.name))
+        if width != self.width:
+            self.width = width
+            self._name_segments = {}
+
+    def _name_segment(self, name):
+        segment = self._name_segments.get(name)
+        if segment is None:
+            padded = (name or '').ljust(self.width)
+            if padded:
+                padded += ' '
+            segment = ' {name}| '.format(name=padded)
+            if self.binary:
+                segment = segment.encode('utf-8')
+            self._name_segments[name] = segment
+        return segment
+
+    def _format_time(self, time):
+        if not self._cache_time:
+            return self._strftime(time)
+        if self._time_from is None or not self._time_from <= time < self._time_till:
+            self._time_from = time.replace(microsecond=0)
+            self._time_till = self._time_from + datetime.timedelta(seconds=1)
+            self._time_formatted = self._strftime(time)
+        return self._time_formatted
+
+    def _strftime(self, time):
+        formatted = time.strftime(self.time_format)
+        if self.binary:
+            return formatted.encode('utf-8')
+        return formatted
@@ -1,35 +1,49 @@
+import sys
 import threading
 import signal
-import datetime
+import heapq
+import itertools
+import collections
 
-from .messaging import EventBus, Line, Start, Restart, Stop, EmptyBus
-from .utils import now
+from .messaging import EventBus, Line, Start, Restart, Stop, SYSTEM_LABEL, OVERFLOW_BLOCK
+from .multiplexing import OutputMultiplexer
+from .utils import monotonic
 from .system import OS
+from .graph import DependencyGraph, DependencyTracker
+
+
+# Maximum number of messages the Scheduler processes per one wakeup
+RECEIVE_BATCH_SIZE = 1024
+
+# How long the Scheduler waits for messages when nothing happens.
+# Python 2 can't interrupt waiting on a lock by a signal, so there it has to wake up from time to time.
+IDLE_TIMEOUT = 1 if sys.version_info[0] == 2 else None
 
 
 class Executor(object):
     '''
     Runs, re-runs, stops services.
     Each executor is associated with exactly one service.
+    Output of the service is read by the shared output multiplexer.
     '''
-    def __init__(self, event_bus, service):
+    def __init__(self, event_bus, service, multiplexer=None):
         self.event_bus = event_bus
         self._srv = service
+        self._multiplexer = multiplexer
         self.name = service.name
         self.returncode = None
         self.child_pid = None
 
     def start(self):
         '''
-        Start thread for execution of the underlying service.
+        Start execution of the underlying service.
         '''
         self.event_bus.send_system('starting service {s}'.format(s=self._srv.name))
-        th = threading.Thread(name=self.name, target=self._run_service)
-        th.start()
+        self._run_service()
 
     def stop(self, force=False):
         '''
-        Stop thread for execution of the underlying service.
+        Stop execution of the underlying service.
         '''
         kill_type = 'forcefully' if force else 'gracefully'
         msg = 'stopping service {name} (pid={pid}) {method}\n'. \
@@ -48,6 +62,7 @@ class Executor(object):
         Reset return code of the service.
         '''
         self.returncode = None
+        self.child_pid = None
         self._update_readiness()
         self._srv.readiness.retry.do_retry()
 
@@ -59,14 +74,21 @@ class Executor(object):
             return
         self.child_pid = child.pid
         self._send_message({'pid': self.child_pid}, Start)
-        for line in iter(child.stdout.readline, b''):
-            if not self._srv.quiet:
-                self._send_message(line, Line)
-        child.stdout.close()
-        child.wait()
-        self._send_message({'returncode': child.returncode}, Stop)
-        self.returncode = child.returncode
+        self._multiplexer.add(child, self._on_output, self._on_exit, self._has_capacity)
+
+    def _on_output(self, lines):
+        # A whole batch of lines is sent as one message
+        if not self._srv.quiet:
+            self._send_message(lines, Line)
+
+    def _has_capacity(self):
+        return self.event_bus.has_capacity(self.name)
+
+    def _on_exit(self, returncode):
+        self.returncode = returncode
         self._update_readiness()
+        needs_restart, _ = self.needs_restart()
+        self._send_message({'returncode': returncode, 'needs_restart': needs_restart}, Stop)
 
     def _update_readiness(self):
         self._srv.readiness.update_service_state(self.returncode)
@@ -78,9 +100,14 @@ class Executor(object):
 class ExecutorsPool(object):
     '''
     Pooled collection of executors.
+    Keeps counters of executors' states that are updated on their start/stop/restart events,
+    so that the pool state can be checked in O(1).
     '''
     def __init__(self):
         self._executors = {}
+        self._running = set()
+        self._stopped = set()
+        self.pending_restarts = 0
 
     def add(self, executor):
         '''
@@ -88,6 +115,35 @@ class ExecutorsPool(object):
         '''
         self._executors[executor.name] = executor
 
+    def mark_started(self, name):
+        '''
+        Account that executor's service has started.
+        '''
+        self._stopped.discard(name)
+        self._running.add(name)
+
+    def mark_stopped(self, name, needs_restart=False):
+        '''
+        Account that executor's service has stopped (or failed to start).
+        '''
+        self._running.discard(name)
+        self._stopped.add(name)
+        if needs_restart:
+            self.pending_restarts += 1
+
+    def mark_restarting(self, name):
+        '''
+        Account that executor's service is being restarted.
+        '''
+        self._stopped.discard(name)
+        self.pending_restarts -= 1
+
+    def all_exited(self):
+        '''
+        Have all executors' services stopped according to the accounted events?
+        '''
+        return len(self._stopped) == len(self._executors)
+
     def get(self, name):
         '''
         Get executor from pool.
@@ -109,41 +165,26 @@ class ExecutorsPool(object):
 
     def stop_all(self, force=False):
         '''
-        Stop all executors in the pool. Unless they already haven't exited by themselves.
+        Stop all executors in the pool. Unless they already haven't exited by themselves or haven't started.
         '''
         for executor in self.all():
-            if executor.returncode is None:
+            if executor.returncode is None and executor.child_pid is not None:
                 executor.stop(force)
 
-    def all_started(self):
-        '''
-        Are all executors started?
-        '''
-        return all(e.child_pid is not None for e in self.all())
-
-    def any_needs_restart(self):
-        '''
-        Does any of the executors need to be retried?
-        '''
-        return any(e.needs_restart()[0] for e in self.all())
-
-    def all_stopped(self):
-        '''
-        Are all executors stopped?
-        '''
-        return all(e.returncode is not None for e in self.all())
-
 
 class Supervisor(object):
     '''
-    Supervises status, execution, readiness of services and jobs.
+    Supervises restarts of failed services and jobs.
+    Pending restarts are kept in a heap ordered by their deadlines, so that every service
+    is restarted exactly after its wait time, independently of the others.
     '''
-    def __init__(self, event_bus, exec_pool, check_interval_sec=10):
+    def __init__(self, event_bus, exec_pool):
         self.name = 'local_compose_supervisor'
         self.eb = event_bus
         self.exec_pool = exec_pool
-        self._check_interval_sec = check_interval_sec
-        self._event = threading.Event()
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
         self._stop = False
 
     def launch(self):
@@ -157,38 +198,58 @@ class Supervisor(object):
         '''
         Stop supervision.
         '''
-        self._stop = True
-        self._event.set()
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+    def schedule_restart(self, executor):
+        '''
+        Schedule restart of the executor after its wait time.
+        '''
+        _, wait_sec = executor.needs_restart()
+        executor.reset()
+        with self._cond:
+            # Sequence number keeps restarts with the same deadline in the order they were scheduled
+            heapq.heappush(self._deadlines, (monotonic() + wait_sec, next(self._sequence), executor.name))
+            self._cond.notify()
 
     def monitor(self):
         '''
         The actual supervision method.
         '''
-        while not self._stop:
-            # todo - without this sleep constant fast loop consumes CPU drastically!
-            # we fixed it, but we need to decide on setting it correctly
-            self._event.wait(self._check_interval_sec)
-            for executor in self.exec_pool.all():
-                needs_restart, wait_sec = executor.needs_restart()
-                if needs_restart:
-                    executor.reset()
-                    self._event.wait(wait_sec)
-                    self.eb.send_system({'name': executor.name}, Restart)
+        with self._cond:
+            while not self._stop:
+                current = monotonic()
+                while self._deadlines and self._deadlines[0][0] <= current:
+                    _, _, name = heapq.heappop(self._deadlines)
+                    self.eb.send_system({'name': name}, Restart)
+                timeout = None
+                if self._deadlines:
+                    timeout = self._deadlines[0][0] - current
+                self._cond.wait(timeout)
 
 
 class Scheduler(object):
     '''
     Manager for scheduling, running, stopping and monitoring services.
+    Output of each service waiting to be printed can be limited by max_buffered_lines,
+    overflow sets what to do when the limit is exceeded.
+    Services are started as soon as the services they depend on are ready.
     '''
-    def __init__(self, printer, kill_wait=5):
-        self.event_bus = EventBus()
+    def __init__(self, printer, kill_wait=5, max_buffered_lines=None, overflow=OVERFLOW_BLOCK):
+        self._multiplexer = OutputMultiplexer()
+        self.event_bus = EventBus(max_lines=max_buffered_lines, overflow=overflow,
+                                  on_capacity=self._multiplexer.resume)
         # todo - set it correctly
         self.returncode = None
         self.kill_wait = kill_wait
         self._printer = printer
         self._pool = ExecutorsPool()
         self._supervisor = Supervisor(self.event_bus, self._pool)
+        self._dependencies = collections.OrderedDict()
+        self._tracker = None
         self._terminating = False
+        self._kill_at = None
         self.signals = {
             signal.SIGINT: {
                 'name': 'SIGINT',
@@ -204,56 +265,93 @@ class Scheduler(object):
         '''
         Register Service within the Scheduler.
         '''
-        executor = Executor(self.event_bus, service)
+        executor = Executor(self.event_bus, service, self._multiplexer)
         self._pool.add(executor)
-        self._printer.adjust_width(service)
+        self._dependencies[service.name] = service.depends_on
+        self._printer.register(service)
 
     def start(self):
         '''
         Start the main managing and execution logic of the Scheduler.
         '''
-        self._pool.start_all()
+        self._multiplexer.launch()
+        self._tracker = DependencyTracker(DependencyGraph(self._dependencies))
+        self._start(self._tracker.start())
         self._supervisor.launch()
 
-        do_exit = False
-        exit_start = None
-
+        done = False
         while True:
-            msg = self.event_bus.receive(timeout=0.1)
-            if isinstance(msg, EmptyBus) and do_exit:
+            if done:
+                # Just drain what's left
+                timeout = 0
+            elif self._kill_at is not None:
+                timeout = max(0, self._kill_at - monotonic())
+            else:
+                timeout = IDLE_TIMEOUT
+            messages = self.event_bus.receive_many(RECEIVE_BATCH_SIZE, timeout=timeout)
+            if not messages and done:
                 break
-            if isinstance(msg, Line):
-                self._printer.write(msg)
-            elif isinstance(msg, Start):
-                pid = msg.data['pid']
-                self.event_bus.send_system('{name} started (pid={pid})\n'.format(name=msg.name, pid=pid))
-            elif isinstance(msg, Restart):
-                name = msg.data['name']
-                self.event_bus.send_system('{name} is restarting\n'.format(name=name))
-                self._pool.get(name).start()
-            elif isinstance(msg, Stop):
-                # ToDo: here might be no returncode
-                rc = msg.data['returncode']
-                self.event_bus.send_system('{name} stopped (rc={rc})\n'.format(name=msg.name, rc=rc))
-                if self.returncode is None:
-                    self.returncode = rc
-
-            if self._pool.all_started() and \
-                self._pool.all_stopped() and \
-                (not self._pool.any_needs_restart() or self._terminating):
-
-                do_exit = True
-                # It will be our guard against hanging executors
-                if exit_start is None:
-                    exit_start = now()
+            for msg in messages:
+                self._process(msg)
+            # Batch that hasn't filled up means the bus has been drained
+            if len(messages) < RECEIVE_BATCH_SIZE:
+                self._printer.idle()
+
+            # Pool state is evaluated once per batch of messages
+            if not done and self._pool.all_exited() and \
+                (self._pool.pending_restarts == 0 or self._terminating):
+                done = True
                 self.terminate()
 
-            if exit_start is not None:
-                # If we're running (though have triggered an exit) more than kill_wait seconds,
-                # we need to kill all the hanging executors.
-                waiting = now() - exit_start
-                if waiting > datetime.timedelta(seconds=self.kill_wait):
-                    self._kill()
+            # If we're running (though have triggered an exit) more than kill_wait seconds,
+            # we need to kill all the hanging executors.
+            if not done and self._kill_at is not None and monotonic() >= self._kill_at:
+                self._kill_at = None
+                self._kill()
+        self._multiplexer.stop()
+        for name, count in sorted(self.event_bus.dropped_lines().items()):
+            self._printer.write(Line(data='{count} output lines of {name} were dropped\n'.format(
+                count=count, name=name), name=SYSTEM_LABEL))
+        self._printer.close()
+
+    def _process(self, msg):
+        if isinstance(msg, Line):
+            self._printer.write(msg)
+        elif isinstance(msg, Start):
+            pid = msg.data['pid']
+            self._pool.mark_started(msg.name)
+            self.event_bus.send_system('{name} started (pid={pid})\n'.format(name=msg.name, pid=pid))
+            self._start(self._tracker.service_started(msg.name))
+        elif isinstance(msg, Restart):
+            name = msg.data['name']
+            self._pool.mark_restarting(name)
+            if self._terminating:
+                self._pool.mark_stopped(name)
+                return
+            self.event_bus.send_system('{name} is restarting\n'.format(name=name))
+            self._pool.get(name).start()
+        elif isinstance(msg, Stop):
+            # There's no returncode if the service has failed to start
+            rc = msg.data.get('returncode')
+            needs_restart = msg.data.get('needs_restart', False) and not self._terminating
+            self._pool.mark_stopped(msg.name, needs_restart)
+            if needs_restart:
+                self._supervisor.schedule_restart(self._pool.get(msg.name))
+            self.event_bus.send_system('{name} stopped (rc={rc})\n'.format(name=msg.name, rc=rc))
+            if self.returncode is None:
+                self.returncode = rc
+            ready, skipped = self._tracker.service_exited(msg.name, rc, needs_restart)
+            for name, failed in skipped:
+                self._pool.mark_stopped(name)
+                self.event_bus.send_system('{name} is skipped as {failed} has failed\n'.format(
+                    name=name, failed=failed))
+            self._start(ready)
+
+    def _start(self, names):
+        if self._terminating:
+            return
+        for name in names:
+            self._pool.get(name).start()
 
     def terminate(self):
         '''
@@ -262,7 +360,12 @@ class Scheduler(object):
         if self._terminating:
             return
         self._terminating = True
+        self._kill_at = monotonic() + self.kill_wait
         self._supervisor.stop()
+        # Services still waiting for their dependencies will never start
+        if self._tracker is not None:
+            for name in self._tracker.skip_waiting():
+                self._pool.mark_stopped(name)
         self._pool.stop_all()
 
     def terminate_by_signal(self, signum):
@@ -64,6 +64,42 @@ JSON_SCHEMA = {
                     'type': 'boolean',
                     'default': True,
                 },
+                'format': {
+                    'description': "Format of service's output in console: " \
+                        'text - lines with the time and service name prefix, ' \
+                        'json - one JSON object per line',
+                    'type': 'string',
+                    'enum': ['text', 'json'],
+                    'default': 'text',
+                },
+                'binary': {
+                    'description': "Keep service's output as bytes all the way to stdout and files " \
+                        'instead of decoding it to text?',
+                    'type': 'boolean',
+                    'default': False,
+                },
+                'buffer': {
+                    'description': "Limits of the services' output waiting to be printed",
+                    'type': 'object',
+                    'default': {},
+                    'properties': {
+                        'maxLines': {
+                            'description': 'How many lines of each service output can wait to be printed',
+                            'type': 'integer',
+                            'minimum': 1,
+                            'default': 10000,
+                        },
+                        'overflow': {
+                            'description': 'What to do when the limit is exceeded: ' \
+                                'block - pause reading of the service output, ' \
+                                'dropOldest - drop the oldest waiting lines, ' \
+                                'coalesce - drop the new lines and print how many lines were dropped',
+                            'type': 'string',
+                            'enum': ['block', 'dropOldest', 'coalesce'],
+                            'default': 'block',
+                        },
+                    },
+                },
                 'toFile': {
                     'description': 'Output to file configuration',
                     'type': 'object',
@@ -88,6 +124,20 @@ JSON_SCHEMA = {
                             'type': 'number',
                             'default': 0,
                         },
+                        'compression': {
+                            'description': 'How to compress the rotated files (lzma requires Python 3)',
+                            'type': 'string',
+                            'enum': ['none', 'gzip', 'lzma'],
+                            'default': 'none',
+                        },
+                        'compressionLevel': {
+                            'description': 'Compression level of the rotated files: ' \
+                                'from 0 (fastest) to 9 (smallest)',
+                            'type': 'integer',
+                            'minimum': 0,
+                            'maximum': 9,
+                            'default': 6,
+                        },
                     },
                 },
             },
@@ -119,6 +169,20 @@ JSON_SCHEMA = {
             },
             'additionalProperties': False,
         },
+        'dependency': {
+            'type': 'object',
+            'properties': {
+                'condition': {
+                    'description': 'When the dependency is ready: ' \
+                        'started - its process has started, ' \
+                        'completedSuccessfully - its process has exited with 0 return code',
+                    'type': 'string',
+                    'enum': ['started', 'completedSuccessfully'],
+                    'default': 'started',
+                },
+            },
+            'additionalProperties': False,
+        },
         'service': {
             'type': 'object',
             'required': [
@@ -190,6 +254,22 @@ JSON_SCHEMA = {
                     'description': 'Service outputs are streamed into this file',
                     'type': 'string',
                 },
+                'dependsOn': {
+                    'description': 'Services that must be ready before this service is started: ' \
+                        'a list of their names or a map of their names to the readiness conditions',
+                    'type': ['array', 'object'],
+                    'items': {
+                        'type': 'string'
+                    },
+                    'minItems': 1,
+                    'uniqueItems': True,
+                    'patternProperties': {
+                        '^[a-zA-Z0-9._-]+$': {
+                            '$ref': '#/definitions/dependency'
+                        },
+                    },
+                    'additionalProperties': False,
+                },
                 'readiness': {
                     'description': 'Method that can determine if service has started successfully. \
                         Currently it uses only service exit code as a probe',
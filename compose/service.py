@@ -12,7 +12,7 @@ class Service(object):
     '''
     def __init__(self, name, cmd, color=None, quiet=False,
                  env=None, cwd=None, shell=False,
-                 readiness=None, log_to_file=None):
+                 readiness=None, log_to_file=None, depends_on=None):
         self.name = name
         self.cmd = cmd
         self.color = color
@@ -23,31 +23,57 @@ class Service(object):
             cwd = os.getcwd()
         self.cwd = cwd
         self.log_to_file = log_to_file
+        # File the output is appended to directly by the OS process instead of being piped through us
+        self.output_file = None
         self.in_shell = shell
         self._os = OS()
         self.pid = None
         self.readiness = Readiness(readiness)
+        # Names of the services that must be ready before this one is started -> readiness condition
+        self.depends_on = depends_on or {}
 
     def run(self):
         '''
         Run service as the OS process.
         '''
-        if not self.in_shell:
-            command = shlex.split(self.cmd)
-        else:
-            command = self.cmd
-        proc = subprocess.Popen(command,
-                                env=self.env,
-                                cwd=self.cwd,
-                                shell=self.in_shell,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT,
-                                # todo - breaks on py27
-                                # start_new_session=True,
-                                close_fds=True)
+        output = self.open_output()
+        try:
+            proc = subprocess.Popen(self.command(),
+                                    env=self.env,
+                                    cwd=self.cwd,
+                                    shell=self.in_shell,
+                                    stdout=subprocess.PIPE if output is None else output,
+                                    stderr=subprocess.STDOUT,
+                                    # todo - breaks on py27
+                                    # start_new_session=True,
+                                    close_fds=True)
+        finally:
+            if output is not None:
+                output.close()
         self.pid = proc.pid
         return proc
 
+    def open_output(self):
+        '''
+        Open the file the OS process should write its output to directly:
+        /dev/null for a quiet service, output_file if it's set.
+        Returns None if the output should be piped.
+        '''
+        if self.quiet:
+            return open(os.devnull, 'wb')
+        if self.output_file is not None:
+            # Appending mode: writes always go to the end even if the file is truncated by rotation
+            return open(self.output_file, 'ab')
+        return None
+
+    def command(self):
+        '''
+        Command that runs the service: either a string for the shell or a list of program arguments.
+        '''
+        if self.in_shell:
+            return self.cmd
+        return shlex.split(self.cmd)
+
     def stop(self, force=False):
         '''
         Stop OS process that represents the service.
@@ -1,4 +1,5 @@
 import datetime
+import time
 
 
 def now():
@@ -6,3 +7,12 @@ def now():
     Get current system timestamp
     '''
     return datetime.datetime.now()
+
+
+def monotonic():
+    '''
+    Get current value of a monotonic clock in seconds (falls back to system time on Python 2)
+    '''
+    if hasattr(time, 'monotonic'):
+        return time.monotonic()
+    return time.time()
@@ -0,0 +1,195 @@
+'''
+Fast validation of configs against a JSON schema.
+The schema is translated into Python source of plain checking functions, one per subschema, which is compiled once.
+Only the subset of draft-7 keywords that local-compose schema uses is supported.
+'''
+import numbers
+import re
+import sys
+
+
+if sys.version_info[0] == 2:
+    _STRING_TYPES = (basestring,)
+    _INTEGER_TYPES = (int, long)
+else:
+    _STRING_TYPES = (str,)
+    _INTEGER_TYPES = (int,)
+
+# Keywords that don't affect validation
+_ANNOTATIONS = frozenset(['$id', '$schema', '$comment', 'title', 'description', 'default', 'examples', 'definitions'])
+
+_TYPE_CHECKS = {
+    'object': 'isinstance({v}, dict)',
+    'array': 'isinstance({v}, list)',
+    'string': 'isinstance({v}, _STRING_TYPES)',
+    'boolean': '({v} is True or {v} is False)',
+    'null': '{v} is None',
+    'integer': '(isinstance({v}, _INTEGER_TYPES) and not isinstance({v}, bool))',
+    'number': '(isinstance({v}, numbers.Number) and not isinstance({v}, bool))',
+}
+
+
+def compile_schema(schema):
+    '''
+    Build a function that checks if an instance is valid against the schema.
+    Like the jsonschema based validator in configuration, it fills in default values of missing properties
+    (the very objects from the schema) before validating them.
+    The function is conservative: it may reject a valid instance in rare edge cases
+    (e.g. 1.0 as integer), so a rejected instance must be re-checked by jsonschema.
+    Raises ValueError if the schema uses keywords that aren't supported.
+    '''
+    return _Compiler(schema).compile()
+
+
+def _unique(items):
+    try:
+        return len(set(items)) == len(items)
+    except TypeError:
+        return False
+
+
+class _Compiler(object):
+    def __init__(self, schema):
+        self._schema = schema
+        self._lines = []
+        self._namespace = {
+            're': re,
+            'numbers': numbers,
+            '_STRING_TYPES': _STRING_TYPES,
+            '_INTEGER_TYPES': _INTEGER_TYPES,
+            '_unique': _unique,
+        }
+        self._functions = {}
+        self._pending = []
+
+    def compile(self):
+        root = self._function(self._schema)
+        while self._pending:
+            self._emit_function(*self._pending.pop(0))
+        code = compile('\n'.join(self._lines), '<compiled schema>', 'exec')
+        exec(code, self._namespace)
+        return self._namespace[root]
+
+    def _function(self, schema):
+        '''
+        Name of the function checking the subschema.
+        '''
+        if not isinstance(schema, dict):
+            raise ValueError('Schema %r is not supported' % (schema,))
+        # Draft-7 ignores everything next to $ref
+        if '$ref' in schema:
+            schema = self._resolve(schema['$ref'])
+        name = self._functions.get(id(schema))
+        if name is None:
+            name = self._functions[id(schema)] = '_check_%d' % len(self._functions)
+            self._pending.append((name, schema))
+        return name
+
+    def _resolve(self, ref):
+        if not ref.startswith('#'):
+            raise ValueError('Remote $ref "%s" is not supported' % ref)
+        target = self._schema
+        for part in ref[1:].split('/')[1:]:
+            target = target[part.replace('~1', '/').replace('~0', '~')]
+        return target
+
+    def _constant(self, value):
+        name = '_const_%d' % len(self._namespace)
+        self._namespace[name] = value
+        return name
+
+    def _emit(self, indent, line):
+        self._lines.append('    ' * indent + line)
+
+    def _emit_function(self, name, schema):
+        self._emit(0, 'def %s(value):' % name)
+        for keyword, arg in schema.items():
+            if keyword in _ANNOTATIONS:
+                continue
+            emitter = getattr(self, '_emit_' + keyword, None)
+            if emitter is None:
+                raise ValueError('Keyword "%s" is not supported' % keyword)
+            emitter(arg, schema)
+        self._emit(1, 'return True')
+        self._emit(0, '')
+
+    def _emit_type(self, types, _schema):
+        if not isinstance(types, list):
+            types = [types]
+        checks = [_TYPE_CHECKS[t].format(v='value') for t in types]
+        self._emit(1, 'if not (%s):' % ' or '.join(checks))
+        self._emit(2, 'return False')
+
+    def _emit_required(self, names, _schema):
+        self._emit(1, 'if isinstance(value, dict):')
+        for n in names:
+            self._emit(2, 'if %r not in value:' % n)
+            self._emit(3, 'return False')
+
+    def _emit_properties(self, properties, _schema):
+        # Defaults are inserted into objects only, anything else is left for jsonschema to report
+        self._emit(1, 'if not isinstance(value, dict):')
+        self._emit(2, 'return False')
+        for n, subschema in properties.items():
+            if 'default' in subschema:
+                self._emit(1, 'value.setdefault(%r, %s)' % (n, self._constant(subschema['default'])))
+        for n, subschema in properties.items():
+            if _is_annotation_only(subschema):
+                continue
+            self._emit(1, 'if %r in value and not %s(value[%r]):' % (n, self._function(subschema), n))
+            self._emit(2, 'return False')
+
+    def _emit_patternProperties(self, patterns, _schema):
+        self._emit(1, 'if isinstance(value, dict):')
+        self._emit(2, 'for key, item in value.items():')
+        self._emit(3, 'if not isinstance(key, _STRING_TYPES):')
+        self._emit(4, 'return False')
+        for pattern, subschema in patterns.items():
+            regex = self._constant(re.compile(pattern))
+            self._emit(3, 'if %s.search(key) and not %s(item):' % (regex, self._function(subschema)))
+            self._emit(4, 'return False')
+
+    def _emit_additionalProperties(self, allowed, schema):
+        if allowed is not False:
+            raise ValueError('Only false additionalProperties is supported')
+        known = self._constant(frozenset(schema.get('properties', {})))
+        regexes = self._constant(tuple(re.compile(p) for p in schema.get('patternProperties', {})))
+        self._emit(1, 'if isinstance(value, dict):')
+        self._emit(2, 'for key in value:')
+        self._emit(3, 'if not isinstance(key, _STRING_TYPES):')
+        self._emit(4, 'return False')
+        self._emit(3, 'if key not in %s and not any(r.search(key) for r in %s):' % (known, regexes))
+        self._emit(4, 'return False')
+
+    def _emit_enum(self, values, _schema):
+        if not all(isinstance(v, _STRING_TYPES) for v in values):
+            raise ValueError('Only enums of strings are supported')
+        self._emit(1, 'if not (isinstance(value, _STRING_TYPES) and value in %s):' % self._constant(frozenset(values)))
+        self._emit(2, 'return False')
+
+    def _emit_minimum(self, limit, _schema):
+        self._emit(1, 'if %s and value < %r:' % (_TYPE_CHECKS['number'].format(v='value'), limit))
+        self._emit(2, 'return False')
+
+    def _emit_maximum(self, limit, _schema):
+        self._emit(1, 'if %s and value > %r:' % (_TYPE_CHECKS['number'].format(v='value'), limit))
+        self._emit(2, 'return False')
+
+    def _emit_items(self, subschema, _schema):
+        self._emit(1, 'if isinstance(value, list):')
+        self._emit(2, 'for item in value:')
+        self._emit(3, 'if not %s(item):' % self._function(subschema))
+        self._emit(4, 'return False')
+
+    def _emit_minItems(self, count, _schema):
+        self._emit(1, 'if isinstance(value, list) and len(value) < %d:' % count)
+        self._emit(2, 'return False')
+
+    def _emit_uniqueItems(self, unique, _schema):
+        if unique:
+            self._emit(1, 'if isinstance(value, list) and not _unique(value):')
+            self._emit(2, 'return False')
+
+
+def _is_annotation_only(schema):
+    return isinstance(schema, dict) and '$ref' not in schema and all(k in _ANNOTATIONS for k in schema)
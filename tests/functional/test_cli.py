@@ -1,6 +1,9 @@
+import json
 import os
 import re
 import time
+import subprocess
+import sys
 
 import pytest
 from click.testing import CliRunner
@@ -9,6 +12,12 @@ import compose.cli as cli
 from compose.info import CONFIG_EXAMPLE
 
 
+@pytest.fixture(autouse=True)
+def config_cache_dir(tmpdir_factory, monkeypatch):
+    # Parsed configs are cached away from the user's cache dir
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir_factory.mktemp('cache')))
+
+
 def test_no_args():
     runner = CliRunner()
     result = runner.invoke(cli.root, [])
@@ -119,6 +128,158 @@ def test_up_silent():
 '''
 
 
+def test_up_binary():
+    runner = CliRunner()
+    file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'binary.yaml')
+    result = runner.invoke(cli.root, ['up', '-f', file])
+    assert result.exit_code == 0
+    out = re.sub(br'pid=\d+', b'pid=22580', result.stdout_bytes)
+    assert out == \
+b''' system  | starting service my-job1
+ system  | my-job1 started (pid=22580)
+ my-job1 | caf\xc3\xa9 \xff
+ system  | my-job1 stopped (rc=0)
+'''
+
+
+def test_up_json(tmpdir):
+    config_file = tmpdir.join('local-compose.yaml')
+    config_file.write('''
+version: '0.1'
+
+settings:
+  logging:
+    format: json
+    toFile:
+      enabled: yes
+
+services:
+  my-job1:
+    run: sleep 0.1 && echo '"hello"'
+    shell: yes
+    logToFile: %s
+''' % tmpdir.join('my-job1.log'))
+    runner = CliRunner()
+    result = runner.invoke(cli.root, ['up', '-f', str(config_file)])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert [(r['service'], r['stream'], r['message']) for r in records] == [
+        ('system', 'system', 'starting service my-job1'),
+        ('system', 'system', 'my-job1 started (pid=%d)' % records[2]['pid']),
+        ('my-job1', 'stdout', '"hello"'),
+        ('system', 'system', 'my-job1 stopped (rc=0)'),
+    ]
+    assert isinstance(records[0]['time'], float)
+    # Log files keep the text format
+    assert tmpdir.join('my-job1.log').read().endswith(' my-job1 | "hello"\n')
+
+
+@pytest.mark.parametrize('engine', [
+    'threads',
+    'asyncio',
+])
+def test_up_logging_to_file_only(tmpdir, engine):
+    log_file = tmpdir.join('my-job1.log')
+    config_file = tmpdir.join('local-compose.yaml')
+    config_file.write('''
+version: '0.1'
+
+settings:
+  logging:
+    toStdout: no
+    toFile:
+      enabled: yes
+
+services:
+  my-job1:
+    run: echo "Hello world" && echo "Bye world" >&2
+    shell: yes
+    logToFile: %s
+  my-job2:
+    run: echo "Hello silence"
+    shell: yes
+    silent: yes
+''' % log_file)
+    runner = CliRunner()
+    result = runner.invoke(cli.root, ['up', '-f', str(config_file), '--engine', engine])
+    assert result.exit_code == 0
+    assert result.output == ''
+    assert log_file.read() == 'Hello world\nBye world\n'
+
+
+def test_logs(tmpdir):
+    config_file = tmpdir.join('local-compose.yaml')
+    config_file.write('''
+version: '0.1'
+
+settings:
+  logging:
+    timeFormat: ''
+    toFile:
+      enabled: yes
+
+services:
+  my-job1:
+    run: echo "Hello world"
+    shell: yes
+    logToFile: %s
+  my-job2:
+    run: echo "Hello there" && echo "Bye"
+    shell: yes
+    logToFile: %s
+''' % (tmpdir.join('my-job1.log'), tmpdir.join('my-job2.log')))
+    runner = CliRunner()
+    result = runner.invoke(cli.root, ['up', '-f', str(config_file)])
+    assert result.exit_code == 0
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file)])
+    assert result.exit_code == 0
+    assert result.output == ' my-job1 | Hello world\n'
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file), '--since', '2000-01-01'])
+    assert result.exit_code == 0
+    assert result.output == ' my-job1 | Hello world\n'
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file), '--until', '2000-01-01'])
+    assert result.exit_code == 0
+    assert result.output == ''
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file), '--until', 'tomorrow'])
+    assert result.exit_code == 2
+    assert 'unknown time format "tomorrow"' in result.output
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file), '--tail', '1'])
+    assert result.exit_code == 0
+    assert result.output == ' my-job1 | Hello world\n'
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file), '--tail', '0'])
+    assert result.exit_code == 0
+    assert result.output == ''
+    result = runner.invoke(cli.root, ['logs', 'my-job1', '-f', str(config_file), '-n', '1', '--since', '10:00'])
+    assert result.exit_code == 2
+    assert "--tail can't be used together with --since or --until" in result.output
+    result = runner.invoke(cli.root, ['logs', 'my-job3', '-f', str(config_file)])
+    assert result.exit_code == 1
+    assert result.output == 'Service "my-job3" is not defined\n'
+    result = runner.invoke(cli.root, ['logs', 'my-job1', 'my-job2', '-f', str(config_file)])
+    assert result.exit_code == 2
+    assert 'Exactly one service is expected' in result.output
+    result = runner.invoke(cli.root, ['logs', 'my-job2', 'my-job1', '-f', str(config_file), '--merged'])
+    assert result.exit_code == 0
+    assert sorted(result.output.splitlines()) == [' my-job1 | Hello world', ' my-job2 | Bye', ' my-job2 | Hello there']
+    assert result.output.index('Hello there') < result.output.index('Bye')
+    result = runner.invoke(cli.root, ['logs', '-f', str(config_file), '--merged', '--tail', '1'])
+    assert result.exit_code == 2
+    assert "--merged can't be used together with --tail, --follow or --grep" in result.output
+    result = runner.invoke(cli.root, ['logs', '-f', str(config_file), '--grep', 'Hello'])
+    assert result.exit_code == 0
+    out = re.sub(r'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d', '2019-01-17 13:01:13', result.output)
+    assert out == \
+'''my-job1 2019-01-17 13:01:13 |  my-job1 | Hello world
+my-job2 2019-01-17 13:01:13 |  my-job2 | Hello there
+'''
+    result = runner.invoke(cli.root, ['logs', 'my-job2', '-f', str(config_file), '--grep', 'Bye$'])
+    assert result.exit_code == 0
+    assert result.output.endswith(' |  my-job2 | Bye\n')
+    result = runner.invoke(cli.root, ['logs', '-f', str(config_file), '--grep', '('])
+    assert result.exit_code == 2
+    assert 'Invalid value for --grep' in result.output
+
+
 @pytest.mark.skip
 def test_up_with_color():
     runner = CliRunner()
@@ -327,3 +488,119 @@ my-job1 stopped (rc=0)
     result = runner.invoke(cli.root, ['down', '-w', fixtures_work_dir, '-f', 'no-prefix.yaml'])
     assert result.exit_code == 0
     assert result.output == 'Stopped local-compose\n'
+
+
+def test_up_one_job_asyncio_engine():
+    runner = CliRunner()
+    file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'one-job.yaml')
+    result = runner.invoke(cli.root, ['up', '-f', file, '--engine', 'asyncio'])
+    assert result.exit_code == 0
+    out = re.sub(r'pid=\d+', 'pid=22580', result.output)
+    assert out == \
+''' system  | starting service my-job1
+ system  | my-job1 started (pid=22580)
+ my-job1 | Hello world
+ system  | my-job1 stopped (rc=0)
+'''
+
+
+def test_up_with_job_and_daemon_asyncio_engine():
+    runner = CliRunner()
+    file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'job-and-daemon.yaml')
+    result = runner.invoke(cli.root, ['up', '-f', file, '--engine', 'asyncio'])
+    assert result.exit_code == 0
+    assert \
+'''
+Job says I'm done
+echo1 stopped (rc=0)
+Long running says I'm done
+web1 stopped (rc=0)
+''' in result.output
+
+
+def test_up_with_job_retries_asyncio_engine():
+    runner = CliRunner()
+    file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'one-job-retries.yaml')
+    result = runner.invoke(cli.root, ['up', '-f', file, '--engine', 'asyncio'])
+    assert result.exit_code == 0
+    out = re.sub(r'pid=\d+', 'pid=22580', result.output)
+    assert out == \
+'''starting service my-job1
+my-job1 started (pid=22580)
+Hello world
+my-job1 stopped (rc=1)
+my-job1 is restarting
+starting service my-job1
+my-job1 started (pid=22580)
+Hello world
+my-job1 stopped (rc=1)
+my-job1 is restarting
+starting service my-job1
+my-job1 started (pid=22580)
+Hello world
+my-job1 stopped (rc=1)
+my-job1 is restarting
+starting service my-job1
+my-job1 started (pid=22580)
+Hello world
+my-job1 stopped (rc=1)
+'''
+
+
+@pytest.mark.parametrize('engine', [
+    'threads',
+    'asyncio',
+])
+def test_up_depends_on(engine):
+    runner = CliRunner()
+    file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'depends-on.yaml')
+    result = runner.invoke(cli.root, ['up', '-f', file, '--engine', engine])
+    assert result.exit_code == 0
+    out = re.sub(r'pid=\d+', 'pid=22580', result.output).splitlines()
+    # Services without dependencies start first
+    assert out[:2] == ['starting service db', 'starting service broken']
+    assert out.index('db started (pid=22580)') < out.index('starting service migrate')
+    assert out.index('migrate stopped (rc=0)') < out.index('starting service app')
+    assert out.index('app is up') < out.index('db is down')
+    assert 'never is skipped as broken has failed' in out
+    assert 'starting service never' not in out
+
+
+def test_up_no_color_does_not_import_colored():
+    file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'one-job.yaml')
+    script = '''
+import sys
+from click.testing import CliRunner
+import compose.cli as cli
+result = CliRunner().invoke(cli.root, ['up', '-f', sys.argv[1], '--no-color'])
+assert result.exit_code == 0, result.output
+print('colored' in sys.modules)
+'''
+    out = subprocess.check_output([sys.executable, '-c', script, file])
+    assert out.strip() == b'False'
+
+
+def test_startup_does_not_import_heavy_modules():
+    script = '''
+import sys
+import compose.cli
+print(' '.join(m for m in ('yaml', 'jsonschema', 'dotenv', 'colored', 'multiprocessing', 'mmap') if m in sys.modules))
+'''
+    out = subprocess.check_output([sys.executable, '-c', script])
+    assert out.strip() == b''
+
+
+# Seconds importing the CLI may take at most
+STARTUP_TIME_BUDGET = 0.15
+
+
+def test_startup_time_budget():
+    script = '''
+import time
+start = time.time()
+import compose.cli
+print(time.time() - start)
+'''
+    # The best of several runs is taken to tolerate noise on a busy machine
+    timings = [float(subprocess.check_output([sys.executable, '-c', script])) for _ in range(3)]
+    assert min(timings) < STARTUP_TIME_BUDGET
@@ -65,6 +65,22 @@ class TestService(object):
         assert s.pid is not None
         assert res == '$FOO $BAR\n'
 
+    def test_run_quiet_writes_to_devnull(self):
+        s = Service(name='info', cmd='echo "OK"', quiet=True)
+        proc = s.run()
+        assert proc.stdout is None
+        assert proc.wait() == 0
+
+    def test_run_writes_to_output_file(self, tmpdir):
+        path = tmpdir.join('info.log')
+        path.write('before\n')
+        s = Service(name='info', cmd='echo "OK" && echo "error" >&2', shell=True)
+        s.output_file = str(path)
+        proc = s.run()
+        assert proc.stdout is None
+        assert proc.wait() == 0
+        assert path.read() == 'before\nOK\nerror\n'
+
     @pytest.mark.parametrize(
         'force',
         [
@@ -0,0 +1,36 @@
+from mock import Mock
+
+from compose.aio import AsyncScheduler
+from compose.service import Service
+
+
+def test_ctor():
+    printer = Mock()
+    sch = AsyncScheduler(printer, 10)
+    sch.register_service(Service(name='web1', cmd='fake'))
+    assert sch.returncode is None
+    assert sch.kill_wait == 10
+    sch2 = AsyncScheduler(printer)
+    assert sch2.returncode is None
+    assert sch2.kill_wait == 5
+
+
+def test_unknown_command_is_stopped():
+    printer = Mock()
+    sch = AsyncScheduler(printer)
+    sch.register_service(Service(name='web1', cmd='local-compose-unknown-command'))
+    sch.start()
+    written = [c[0][0].data for c in printer.write.call_args_list]
+    assert written == ['starting service web1', 'web1 stopped (rc=None)\n']
+    assert sch.returncode is None
+
+
+def test_run_and_output():
+    printer = Mock()
+    sch = AsyncScheduler(printer)
+    sch.register_service(Service(name='web1', cmd='printf "a\\nb\\nc"', shell=True))
+    sch.start()
+    written = [c[0][0].data for c in printer.write.call_args_list]
+    assert b''.join(written[2:-1]) == b'a\nb\nc'
+    assert written[-1] == 'web1 stopped (rc=0)\n'
+    assert sch.returncode == 0
@@ -3,7 +3,7 @@ import os
 import pytest
 import mock
 
-from compose.configuration import Config, ConfigurationError
+from compose.configuration import Config, ConfigCache, ConfigurationError
 from compose.service import Service
 from .helpers import TMP_DIR, set_current_dir_fixture
 
@@ -358,3 +358,196 @@ def test_env_from_map_uses_array_order(mock_read, set_current_dir_fixture):
     conf = Config(FILE_NAME, '/path/workdir').parse()
     envs = conf.services[0].env
     assert envs['MAP_VAL'] == 'val in map db'
+
+
+def test_parse_uses_cache(tmpdir):
+    config_file = tmpdir.join(FILE_NAME)
+    config_file.write('''
+version: '1'
+services:
+    web:
+        run: python -m http.server
+        envFromDotenv: yes
+''')
+    dotenv_file = tmpdir.join('.env')
+    dotenv_file.write('FOO=bar\n')
+    cache = ConfigCache(str(tmpdir.join('cache')))
+    conf = Config(FILE_NAME, str(tmpdir), cache).parse()
+    assert len(tmpdir.join('cache').listdir()) == 1
+    with mock.patch('compose.configuration._load_yaml') as mock_load:
+        cached = Config(FILE_NAME, str(tmpdir), cache).parse()
+        assert not mock_load.called
+    assert cached._conf == conf._conf
+    assert cached.logging['toStdout'] is True
+    assert cached.services[0].env == {'FOO': 'bar'}
+    # .env file has changed
+    dotenv_file.write('FOO=baz\n')
+    dotenv_file.setmtime(dotenv_file.mtime() + 10)
+    with mock.patch('compose.configuration._load_yaml', side_effect=ValueError('not cached')):
+        with pytest.raises(ConfigurationError):
+            Config(FILE_NAME, str(tmpdir), cache).parse()
+    assert Config(FILE_NAME, str(tmpdir), cache).parse().services[0].env == {'FOO': 'baz'}
+    # config has changed
+    config_file.write('''
+version: '2'
+''')
+    assert Config(FILE_NAME, str(tmpdir), cache).parse().version == '2'
+    assert Config(FILE_NAME, str(tmpdir), cache).parse().version == '2'
+
+
+def test_cache_skips_data_not_representable_in_json(tmpdir):
+    tmpdir.join(FILE_NAME).write('''
+version: '1'
+envMaps:
+    dates:
+        TODAY: 2019-01-17
+''')
+    cache = ConfigCache(str(tmpdir.join('cache')))
+    conf = Config(FILE_NAME, str(tmpdir), cache).parse()
+    assert str(conf.env_maps['dates']['TODAY']) == '2019-01-17'
+    assert not tmpdir.join('cache').exists()
+
+
+def test_services_are_built_once_per_parse(tmpdir):
+    tmpdir.join(FILE_NAME).write('''
+version: '1'
+envMaps:
+    common:
+        FOO: foo
+services:
+    web1:
+        run: ruby server.rb
+        envFromMap: [common]
+        envFromDotenv: yes
+    web2:
+        run: ruby server.rb
+        envFromMap: [common]
+        envFromDotenv: yes
+        env:
+            BAR: bar
+''')
+    tmpdir.join('.env').write('BAZ=baz\n')
+    with mock.patch('dotenv.dotenv_values', return_value={'BAZ': 'baz'}) as mock_dotenv:
+        conf = Config(FILE_NAME, str(tmpdir)).parse()
+        services = conf.services
+        assert conf.services is services
+        assert mock_dotenv.call_count == 1
+        assert sorted((s.name, sorted(s.env.items())) for s in services) == [
+            ('web1', [('BAZ', 'baz'), ('FOO', 'foo')]),
+            ('web2', [('BAR', 'bar'), ('BAZ', 'baz'), ('FOO', 'foo')]),
+        ]
+        conf.parse()
+        assert conf.services is not services
+        assert mock_dotenv.call_count == 2
+
+
+@mock.patch.object(Config, 'read')
+def test_valid_config_is_not_validated_by_jsonschema(mock_read):
+    mock_read.return_value = '''
+    version: '1'
+    services:
+        web:
+            run: ruby server.rb
+    '''
+    with mock.patch('compose.configuration._schema_validator') as mock_validator:
+        conf = Config(FILE_NAME, '/path/workdir').parse()
+        assert not mock_validator.called
+    assert conf.logging['timeFormat'] == '%H:%M:%S'
+
+
+@mock.patch.object(Config, 'read')
+def test_depends_on(mock_read):
+    mock_read.return_value = '''
+    version: '1'
+    services:
+        db:
+            run: postgres
+        migrate:
+            run: ./migrate
+            dependsOn: [db]
+        api:
+            run: ./api
+            dependsOn:
+                db: {}
+                migrate:
+                    condition: completedSuccessfully
+    '''
+    services = dict((s.name, s) for s in Config(FILE_NAME, '/path/workdir').parse().services)
+    assert services['db'].depends_on == {}
+    assert services['migrate'].depends_on == {'db': 'started'}
+    assert services['api'].depends_on == {'db': 'started', 'migrate': 'completedSuccessfully'}
+
+
+@pytest.mark.parametrize('depends_on, error', [
+    ('[cache]', 'Service "db" depends on unknown service "cache"'),
+    ('[api]', 'Services depend on each other in a cycle: db -> api -> db'),
+    ('{cache: {condition: exited}}', "'exited' is not one of ['started', 'completedSuccessfully']"),
+    ('[]', "On instance['services']['db']['dependsOn']"),
+])
+@mock.patch.object(Config, 'read')
+def test_depends_on_invalid(mock_read, depends_on, error):
+    mock_read.return_value = '''
+    version: '1'
+    services:
+        db:
+            run: postgres
+            dependsOn: %s
+        api:
+            run: ./api
+            dependsOn: [db]
+    ''' % depends_on
+    with pytest.raises(ConfigurationError) as execinfo:
+        Config(FILE_NAME, '/path/workdir').parse()
+    assert error in str(execinfo.value)
+
+
+@mock.patch.object(Config, 'read')
+def test_unsupported_compression(mock_read):
+    mock_read.return_value = '''
+    version: '1'
+    settings:
+        logging:
+            toFile:
+                compression: lzma
+    '''
+    with mock.patch.dict('sys.modules', {'lzma': None}):
+        with pytest.raises(ConfigurationError) as execinfo:
+            Config(FILE_NAME, '/path/workdir').parse()
+    assert 'Compression "lzma" of log files is not supported by Python' in str(execinfo.value)
+
+
+def test_cache_is_invalidated_by_code_changes(tmpdir):
+    tmpdir.join(FILE_NAME).write('''
+version: '1'
+''')
+    cache = ConfigCache(str(tmpdir.join('cache')))
+    Config(FILE_NAME, str(tmpdir), cache).parse()
+    with mock.patch('compose.configuration._code_digest', return_value=b'schema has changed'):
+        with mock.patch('compose.configuration._load_yaml', side_effect=ValueError('not cached')):
+            with pytest.raises(ConfigurationError):
+                Config(FILE_NAME, str(tmpdir), cache).parse()
+
+
+def test_cache_keeps_most_recently_used_entries(tmpdir):
+    cache = ConfigCache(str(tmpdir.join('cache')), max_entries=2)
+    for name in ['a.yaml', 'b.yaml', 'c.yaml']:
+        tmpdir.join(name).write('''
+version: '1'
+''')
+
+    def age_entries():
+        for entry in tmpdir.join('cache').listdir():
+            entry.setmtime(entry.mtime() - 10)
+    Config('a.yaml', str(tmpdir), cache).parse()
+    age_entries()
+    Config('b.yaml', str(tmpdir), cache).parse()
+    age_entries()
+    # a.yaml is used again, so b.yaml is the least recently used one
+    Config('a.yaml', str(tmpdir), cache).parse()
+    Config('c.yaml', str(tmpdir), cache).parse()
+    assert len(tmpdir.join('cache').listdir()) == 2
+    with mock.patch('compose.configuration._load_yaml', side_effect=ValueError('not cached')):
+        Config('a.yaml', str(tmpdir), cache).parse()
+        Config('c.yaml', str(tmpdir), cache).parse()
+        with pytest.raises(ConfigurationError):
+            Config('b.yaml', str(tmpdir), cache).parse()
@@ -18,10 +18,18 @@ def test_default_values_from_schema_in_settings(mock_read):
             'timeFormat': '%H:%M:%S',
             'usePrefix': True,
             'toStdout': True,
+            'format': 'text',
+            'binary': False,
+            'buffer': {
+                'maxLines': 10000,
+                'overflow': 'block',
+            },
             'toFile': {
                 'enabled': False,
                 'maxSize': 0,
                 'count': 0,
+                'compression': 'none',
+                'compressionLevel': 6,
             },
         },
     }
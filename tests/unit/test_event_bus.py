@@ -1,4 +1,6 @@
-from compose.messaging import EventBus, EmptyBus, Line
+import threading
+
+from compose.messaging import EventBus, EmptyBus, Line, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE
 
 
 def test_receive():
@@ -34,3 +36,85 @@ def test_send_system():
     assert isinstance(msg, Line)
     assert msg.data == 'some custom system message'
     assert msg.name == 'system'
+
+
+def test_receive_many_empty():
+    eb = EventBus()
+    assert eb.receive_many(10, timeout=0.001) == []
+
+
+def test_send_many_and_receive_many():
+    eb = EventBus()
+    eb.send_many([Line('line %d' % i, 'web1') for i in range(5)])
+    eb.send(Line('line 5', 'web2'))
+    msgs = eb.receive_many(4, timeout=0.001)
+    assert [m.data for m in msgs] == ['line 0', 'line 1', 'line 2', 'line 3']
+    msgs = eb.receive_many(timeout=0.001)
+    assert [m.data for m in msgs] == ['line 4', 'line 5']
+    assert [m.name for m in msgs] == ['web1', 'web2']
+    assert eb.receive_many(timeout=0.001) == []
+
+
+def test_receive_many_waits_for_messages():
+    eb = EventBus()
+    timer = threading.Timer(0.05, eb.send, [Line('hello', 'web1')])
+    timer.start()
+    msgs = eb.receive_many(10, timeout=5)
+    assert [m.data for m in msgs] == ['hello']
+
+
+def test_unbounded_by_default():
+    eb = EventBus()
+    for i in range(1000):
+        eb.send(Line(b'line\n', 'web1'))
+    assert eb.has_capacity('web1')
+    assert len(eb.receive_many(timeout=0.001)) == 1000
+    assert eb.dropped_lines() == {}
+
+
+def test_overflow_block():
+    unblocked = []
+    eb = EventBus(max_lines=3, overflow=OVERFLOW_BLOCK, on_capacity=lambda: unblocked.append(True))
+    eb.send(Line(b'1\n2\n', 'web1'))
+    assert eb.has_capacity('web1')
+    eb.send(Line(b'3\n4\n', 'web1'))
+    assert not eb.has_capacity('web1')
+    assert eb.has_capacity('web2')
+    # Nothing is lost when blocking
+    msgs = eb.receive_many(1, timeout=0.001)
+    assert [m.data for m in msgs] == [b'1\n2\n']
+    assert unblocked == [True]
+    assert eb.has_capacity('web1')
+    assert eb.dropped_lines() == {}
+
+
+def test_overflow_drop_oldest():
+    eb = EventBus(max_lines=3, overflow=OVERFLOW_DROP_OLDEST)
+    eb.send(Line(b'1\n', 'web1'))
+    eb.send(Line(b'2\n', 'web2'))
+    eb.send(Line(b'3\n4\n', 'web1'))
+    eb.send(Line(b'5\n6\n', 'web1'))
+    eb.send_system('system is not limited')
+    assert eb.has_capacity('web1')
+    msgs = eb.receive_many(timeout=0.001)
+    # Whole oldest batches are dropped till the new one fits
+    assert [m.data for m in msgs] == [b'2\n', b'5\n6\n', 'system is not limited']
+    assert eb.dropped_lines() == {'web1': 3}
+
+
+def test_overflow_coalesce():
+    eb = EventBus(max_lines=2, overflow=OVERFLOW_COALESCE)
+    eb.send(Line(b'1\n', 'web1', color='red'))
+    eb.send(Line(b'2\n', 'web1', color='red'))
+    eb.send(Line(b'3\n4\n', 'web1', color='red'))
+    eb.send(Line(b'5\n', 'web1', color='red'))
+    assert eb.dropped_lines() == {'web1': 3}
+    msgs = eb.receive_many(timeout=0.001)
+    assert [m.data for m in msgs] == [b'1\n', b'2\n']
+    # Marker is added as soon as there's a capacity for it
+    msgs = eb.receive_many(timeout=0.001)
+    assert [m.data for m in msgs] == ['... 3 lines dropped ...\n']
+    assert msgs[0].name == 'web1'
+    assert msgs[0].color == 'red'
+    eb.send(Line(b'6\n', 'web1'))
+    assert [m.data for m in eb.receive_many(timeout=0.001)] == [b'6\n']
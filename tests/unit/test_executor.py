@@ -1,4 +1,4 @@
-from mock import Mock, patch
+from mock import Mock
 
 from compose.runtime import Executor
 from compose.service import Service
@@ -13,12 +13,9 @@ def test_executor_name():
     assert executor.name == 'web1'
 
 
-@patch('compose.runtime.threading.Thread')
-def test_full_circle(thread_mock):
+def test_full_circle():
     # Process mocks
-    stdout_mock = Mock()
-    stdout_mock.readline.side_effect = ['webserver listens on :80', 'bye', b'']
-    popen_mock = Mock(pid=3333, stdout=stdout_mock, returncode=2)
+    popen_mock = Mock(pid=3333, returncode=2)
     # Service mocks
     srv = Service(name='web1', cmd='fake', quiet=False)
     srv_run_mock = Mock()
@@ -26,13 +23,16 @@ def test_full_circle(thread_mock):
     srv_run_mock.return_value = popen_mock
     srv.run = srv_run_mock
     srv.stop = srv_stop_mock
+    # Multiplexer mocks (a little hack to not execute in a separate thread)
+    def drain(child, on_output, on_exit, has_capacity):
+        on_output(b'webserver listens on :80')
+        on_output(b'bye')
+        on_exit(child.returncode)
+    multiplexer_mock = Mock()
+    multiplexer_mock.add.side_effect = drain
     # Create
     eb = EventBus()
-    executor = Executor(eb, srv)
-    # Thread mocks (a little hack to not execute in a separate thread)
-    thread_obj_mock = Mock()
-    thread_obj_mock.start.side_effect = executor._run_service
-    thread_mock.return_value = thread_obj_mock
+    executor = Executor(eb, srv, multiplexer_mock)
     # state assertions
     assert executor.child_pid is None
     assert executor.returncode is None
@@ -42,14 +42,13 @@ def test_full_circle(thread_mock):
     assert executor.child_pid == 3333
     # call assertions
     srv_run_mock.assert_called_once_with()
-    stdout_mock.close.assert_called_once_with()
-    popen_mock.wait.assert_called_once_with()
+    multiplexer_mock.add.assert_called_once()
     # message assertions
     assert 'starting service web1' in eb.receive().data
     assert eb.receive().data == {'pid': 3333}
-    assert eb.receive().data == 'webserver listens on :80'
-    assert eb.receive().data == 'bye'
-    assert eb.receive().data == {'returncode': 2}
+    assert eb.receive().data == b'webserver listens on :80'
+    assert eb.receive().data == b'bye'
+    assert eb.receive().data == {'returncode': 2, 'needs_restart': False}
     assert isinstance(eb.receive(), EmptyBus)
     # Stop
     executor.stop(force=True)
@@ -83,43 +83,78 @@ def test_stop_all_not_all_have_empty_returncode():
     e3.stop.assert_called_once()
 
 
-def test_all_started():
+def test_all_exited_after_all_stopped():
     ep = ExecutorsPool()
-    e1 = Executor(EventBus(), Service('web1', 'cat'))
-    e2 = Executor(EventBus(), Service('web2', 'cat'))
-    ep.add(e1)
-    ep.add(e2)
-    e1.child_pid = 123
-    e2.child_pid = 1111
-    assert ep.all_started()
+    ep.add(Executor(EventBus(), Service('web1', 'cat')))
+    ep.add(Executor(EventBus(), Service('web2', 'cat')))
+    ep.mark_started('web1')
+    ep.mark_started('web2')
+    ep.mark_stopped('web1')
+    ep.mark_stopped('web2')
+    assert ep.all_exited()
+    assert ep.pending_restarts == 0
 
 
-def test_all_started_not():
+def test_all_exited_not_when_some_are_running_or_not_started():
     ep = ExecutorsPool()
-    e1 = Executor(EventBus(), Service('web1', 'cat'))
-    e2 = Executor(EventBus(), Service('web2', 'cat'))
-    ep.add(e1)
-    ep.add(e2)
-    e1.child_pid = 123
-    assert not ep.all_started()
+    ep.add(Executor(EventBus(), Service('web1', 'cat')))
+    ep.add(Executor(EventBus(), Service('web2', 'cat')))
+    ep.mark_started('web1')
+    ep.mark_stopped('web1')
+    assert not ep.all_exited()
+    ep.mark_started('web2')
+    assert not ep.all_exited()
 
 
-def test_all_stopped():
+def test_restarted_executor_is_not_exited():
     ep = ExecutorsPool()
-    e1 = Executor(EventBus(), Service('web1', 'cat'))
-    e2 = Executor(EventBus(), Service('web2', 'cat'))
+    ep.add(Executor(EventBus(), Service('web1', 'cat')))
+    ep.mark_started('web1')
+    ep.mark_stopped('web1', needs_restart=True)
+    ep.mark_restarting('web1')
+    assert not ep.all_exited()
+    assert ep.pending_restarts == 0
+    ep.mark_started('web1')
+    ep.mark_stopped('web1')
+    assert ep.all_exited()
+
+
+def test_stop_all_not_started():
+    ep = ExecutorsPool()
+    e1 = Mock(returncode=None, child_pid=None)
+    e2 = Mock(returncode=None, child_pid=123)
     ep.add(e1)
     ep.add(e2)
-    e1.returncode = 1
-    e2.returncode = 0
-    assert ep.all_stopped()
+    ep.stop_all()
+    e1.stop.assert_not_called()
+    e2.stop.assert_called_once_with(False)
 
 
-def test_all_stopped_not():
+def test_state_counters():
     ep = ExecutorsPool()
-    e1 = Executor(EventBus(), Service('web1', 'cat'))
-    e2 = Executor(EventBus(), Service('web2', 'cat'))
-    ep.add(e1)
-    ep.add(e2)
-    e1.returncode = 1
-    assert not ep.all_stopped()
+    ep.add(Executor(EventBus(), Service('web1', 'cat')))
+    ep.add(Executor(EventBus(), Service('web2', 'cat')))
+    assert not ep.all_exited()
+    ep.mark_started('web1')
+    ep.mark_started('web2')
+    assert not ep.all_exited()
+    ep.mark_stopped('web1', needs_restart=True)
+    assert not ep.all_exited()
+    assert ep.pending_restarts == 1
+    ep.mark_stopped('web2')
+    assert ep.all_exited()
+    ep.mark_restarting('web1')
+    assert ep.pending_restarts == 0
+    assert not ep.all_exited()
+    ep.mark_started('web1')
+    assert not ep.all_exited()
+    ep.mark_stopped('web1')
+    assert ep.all_exited()
+    assert ep.pending_restarts == 0
+
+
+def test_failed_to_start_is_exited():
+    ep = ExecutorsPool()
+    ep.add(Executor(EventBus(), Service('web1', 'cat')))
+    ep.mark_stopped('web1')
+    assert ep.all_exited()
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+
+import pytest
+
+from compose.graph import DependencyGraph, DependencyTracker, DependencyError
+
+
+def graph(*services):
+    return DependencyGraph(OrderedDict(services))
+
+
+def test_waves():
+    g = graph(
+        ('api', {'db': 'started', 'kafka': 'started'}),
+        ('db', {}),
+        ('migrate', {'db': 'started'}),
+        ('kafka', {}),
+        ('web', {'api': 'started', 'migrate': 'completedSuccessfully'}),
+    )
+    assert g.waves() == [['db', 'kafka'], ['migrate', 'api'], ['web']]
+    assert g.dependents('db') == ['api', 'migrate']
+    assert g.dependencies('web') == {'api': 'started', 'migrate': 'completedSuccessfully'}
+
+
+def test_unknown_dependency():
+    with pytest.raises(DependencyError) as execinfo:
+        graph(('api', {'db': 'started'}))
+    assert str(execinfo.value) == 'Service "api" depends on unknown service "db"'
+
+
+@pytest.mark.parametrize('services, cycle', [
+    ([('api', {'api': 'started'})], 'api -> api'),
+    ([('api', {'db': 'started'}), ('db', {'cache': 'started'}), ('cache', {'api': 'started'}), ('web', {'api': 'started'})],
+     'api -> db -> cache -> api'),
+    ([('web', {'api': 'started'}), ('api', {'db': 'started'}), ('db', {'api': 'started'})], 'api -> db -> api'),
+])
+def test_cycle(services, cycle):
+    with pytest.raises(DependencyError) as execinfo:
+        graph(*services)
+    assert str(execinfo.value) == 'Services depend on each other in a cycle: %s' % cycle
+
+
+def test_tracker_starts_services_when_dependencies_are_ready():
+    t = DependencyTracker(graph(
+        ('db', {}),
+        ('migrate', {'db': 'started'}),
+        ('api', {'db': 'started', 'migrate': 'completedSuccessfully'}),
+        ('cache', {}),
+    ))
+    assert t.start() == ['db', 'cache']
+    assert t.service_started('cache') == []
+    assert t.service_started('db') == ['migrate']
+    assert t.service_started('migrate') == []
+    assert t.service_exited('migrate', 1, restarting=True) == ([], [])
+    assert t.service_started('migrate') == []
+    assert t.service_exited('migrate', 0) == (['api'], [])
+    assert t.service_started('api') == []
+    assert t.skip_waiting() == []
+
+
+def test_tracker_skips_dependents_of_failed_services():
+    t = DependencyTracker(graph(
+        ('db', {}),
+        ('migrate', {'db': 'completedSuccessfully'}),
+        ('api', {'migrate': 'started'}),
+        ('web', {'api': 'started'}),
+        ('cache', {}),
+        ('worker', {'cache': 'started'}),
+    ))
+    assert t.start() == ['db', 'cache']
+    assert t.service_started('db') == []
+    assert t.service_exited('db', 2) == ([], [('migrate', 'db'), ('api', 'migrate'), ('web', 'api')])
+    # cache has failed to start
+    assert t.service_exited('cache', None) == ([], [('worker', 'cache')])
+
+
+def test_tracker_skip_waiting():
+    t = DependencyTracker(graph(
+        ('db', {}),
+        ('api', {'db': 'completedSuccessfully'}),
+    ))
+    assert t.start() == ['db']
+    assert t.service_started('db') == []
+    assert t.skip_waiting() == ['api']
+    assert t.service_exited('db', 0) == ([], [])
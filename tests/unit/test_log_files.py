@@ -0,0 +1,262 @@
+import os
+import sys
+import threading
+import time
+
+import mock
+import pytest
+
+from compose.logfiles import LogFile, LogFilesWriter, Compressor, log_file_path, open_segment, index_path, INDEX_ENTRY
+from compose.service import Service
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def read_index(path):
+    data = read(index_path(path))
+    return [INDEX_ENTRY.unpack_from(data, i) for i in range(0, len(data), INDEX_ENTRY.size)]
+
+
+def test_log_file_appends(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    with open(path, 'wb') as f:
+        f.write(b'old\n')
+    lf = LogFile(path)
+    lf.write(b'new\n')
+    lf.write(b'newer\n')
+    assert lf.size == 14
+    lf.close()
+    assert read(path) == b'old\nnew\nnewer\n'
+
+
+def test_log_file_rotates_when_size_exceeds(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path, max_bytes=10, backup_count=2)
+    for data in [b'1111\n', b'2222\n', b'3333\n', b'4444\n', b'5555\n', b'6666\n', b'7777\n']:
+        lf.write(data)
+    lf.close()
+    assert read(path) == b'7777\n'
+    assert read(path + '.1') == b'5555\n6666\n'
+    assert read(path + '.2') == b'3333\n4444\n'
+    assert not os.path.exists(path + '.3')
+
+
+def test_log_file_rotates_without_backups(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path, max_bytes=10)
+    for data in [b'1111\n', b'2222\n', b'3333\n']:
+        lf.write(data)
+    lf.close()
+    assert read(path) == b'3333\n'
+    assert sorted(os.listdir(str(tmpdir))) == ['web.log', 'web.log.idx']
+
+
+def test_log_file_no_rotation_by_default(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path, backup_count=3)
+    for _ in range(1000):
+        lf.write(b'1234567890\n')
+    lf.close()
+    assert len(read(path)) == 11000
+    assert sorted(os.listdir(str(tmpdir))) == ['web.log', 'web.log.idx']
+
+
+def test_log_files_writer(tmpdir):
+    files = {
+        'web': LogFile(str(tmpdir.join('web.log'))),
+        'db': LogFile(str(tmpdir.join('db.log'))),
+    }
+    w = LogFilesWriter(files)
+    w.send({'web': ([b'a\n', b'b\n'], {}), 'db': ([b'c\n'], {})})
+    w.send({'web': ([b'd\n'], {})})
+    w.close()
+    assert read(str(tmpdir.join('web.log'))) == b'a\nb\nd\n'
+    assert read(str(tmpdir.join('db.log'))) == b'c\n'
+
+
+def test_log_files_writer_uses_own_thread(tmpdir):
+    threads = set()
+
+    class RecordingLogFile(LogFile):
+        def write(self, data):
+            threads.add(threading.current_thread().name)
+            super(RecordingLogFile, self).write(data)
+
+    w = LogFilesWriter({'web': RecordingLogFile(str(tmpdir.join('web.log')))})
+    w.send({'web': ([b'a\n'], {})})
+    w.close()
+    assert threads == {'local_compose_log_files_writer'}
+
+
+def test_log_files_writer_stops_on_error(tmpdir, capsys):
+    class FailingLogFile(LogFile):
+        def write(self, data):
+            raise IOError('No space left on device')
+
+    w = LogFilesWriter({'web': FailingLogFile(str(tmpdir.join('web.log')))})
+    w.send({'web': ([b'a\n'], {})})
+    for _ in range(200):
+        if w.failed:
+            break
+        time.sleep(0.01)
+    assert w.failed
+    assert w._thread.is_alive()
+    w.send({'web': ([b'b\n'], {})})
+    assert w._queue.empty()
+    w.close()
+    assert capsys.readouterr().err == \
+        'local-compose: writing of log files has stopped: No space left on device\n'
+
+
+def test_log_files_writer_close_without_output(tmpdir):
+    w = LogFilesWriter({'web': LogFile(str(tmpdir.join('web.log')))})
+    w.close()
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_log_file_write_lines_rotates_in_between(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path, max_bytes=10, backup_count=5)
+    lf.write_lines([b'1111\n', b'2222\n', b'3333\n', b'4444\n', b'5555\n'])
+    lf.close()
+    assert read(path) == b'5555\n'
+    assert read(path + '.1') == b'3333\n4444\n'
+    assert read(path + '.2') == b'1111\n2222\n'
+
+
+def test_log_file_write_lines_without_limit(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path)
+    lf.write_lines([b'1111\n', b'2222\n'])
+    lf.close()
+    assert read(path) == b'1111\n2222\n'
+
+
+def test_log_file_path():
+    assert log_file_path('/tmp/store', Service(name='web', cmd='true')) == '/tmp/store/web.log'
+    assert log_file_path('/tmp/store', Service(name='web', cmd='true', log_to_file='/var/web.log')) == '/var/web.log'
+
+
+def test_log_file_rotate_by_copy(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path, max_bytes=10, backup_count=2)
+    lf.rotate_by_copy()
+    assert os.listdir(str(tmpdir)) == []
+    with open(path, 'ab', 0) as f:
+        f.write(b'1111\n2222\n')
+        lf.rotate_by_copy()
+        assert read(path) == b'1111\n2222\n'
+        f.write(b'3333\n')
+        lf.rotate_by_copy()
+        f.write(b'4444\n')
+    assert read(path) == b'4444\n'
+    assert read(path + '.1') == b'1111\n2222\n3333\n'
+
+
+def test_log_files_writer_rotates_watched_files(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    w = LogFilesWriter({}, check_interval=0.01)
+    w.watch(LogFile(path, max_bytes=10, backup_count=1))
+    with open(path, 'ab') as f:
+        f.write(b'1111\n2222\n3333\n')
+    for _ in range(100):
+        if os.path.exists(path + '.1'):
+            break
+        time.sleep(0.01)
+    w.close()
+    assert read(path) == b''
+    assert read(path + '.1') == b'1111\n2222\n3333\n'
+
+
+@pytest.mark.parametrize('compression, suffix', [
+    ('gzip', '.gz'),
+    ('lzma', '.xz'),
+])
+def test_log_file_rotates_with_compression(tmpdir, compression, suffix):
+    path = str(tmpdir.join('web.log'))
+    compressor = Compressor(compression, 1)
+    lf = LogFile(path, max_bytes=10, backup_count=2, compressor=compressor)
+    lf.write_lines([b'1111\n', b'2222\n', b'3333\n', b'4444\n', b'5555\n', b'6666\n', b'7777\n'])
+    lf.close()
+    compressor.close()
+    assert sorted(os.listdir(str(tmpdir))) == [
+        'web.log', 'web.log.1' + suffix, 'web.log.1' + suffix + '.idx',
+        'web.log.2' + suffix, 'web.log.2' + suffix + '.idx', 'web.log.idx',
+    ]
+    assert lf.backup_path(2) == path + '.2' + suffix
+    with open_segment(path + '.1' + suffix) as f:
+        assert f.read() == b'5555\n6666\n'
+    with open_segment(path + '.2' + suffix) as f:
+        assert f.read() == b'3333\n4444\n'
+    with open_segment(path) as f:
+        assert f.read() == b'7777\n'
+
+
+def test_compressor_without_lzma():
+    with mock.patch.dict(sys.modules, {'lzma': None}):
+        with pytest.raises(ValueError):
+            Compressor('lzma')
+        Compressor('gzip')
+
+
+def test_compressor_keeps_working_after_failure(tmpdir, capsys):
+    path = str(tmpdir.join('web.log'))
+    compressor = Compressor('gzip')
+    lf = LogFile(path, max_bytes=10, backup_count=2, compressor=compressor)
+    compressor.send(lf, str(tmpdir.join('missing')))
+    lf.write_lines([b'1111\n', b'2222\n', b'3333\n'])
+    lf.close()
+    compressor.close()
+    with open_segment(path + '.1.gz') as f:
+        assert f.read() == b'1111\n2222\n'
+    assert 'local-compose: compression of %s has failed: ' % tmpdir.join('missing') in capsys.readouterr().err
+
+
+def test_log_file_rotate_by_copy_with_compression(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    compressor = Compressor('gzip')
+    lf = LogFile(path, max_bytes=10, backup_count=1, compressor=compressor)
+    with open(path, 'ab', 0) as f:
+        f.write(b'1111\n2222\n3333\n')
+        lf.rotate_by_copy()
+        f.write(b'4444\n')
+    compressor.close()
+    assert read(path) == b'4444\n'
+    with open_segment(path + '.1.gz') as f:
+        assert f.read() == b'1111\n2222\n3333\n'
+    assert sorted(os.listdir(str(tmpdir))) == ['web.log', 'web.log.1.gz']
+
+
+def test_log_file_writes_time_index(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path)
+    lf.write_lines([b'1111\n', b'2222\n', b'3333\n'], {0: 100, 2: 101})
+    lf.write_lines([b'4444\n'], {0: 101})
+    lf.write_lines([b'5555\n'])
+    lf.write_lines([b'6666\n'], {0: 105})
+    lf.close()
+    assert read_index(path) == [(100, 0), (101, 10), (105, 25)]
+
+
+def test_log_file_rotates_time_index(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    lf = LogFile(path, max_bytes=10, backup_count=2)
+    lf.write_lines([b'1111\n', b'2222\n', b'3333\n', b'4444\n', b'5555\n'], {0: 100, 3: 101})
+    lf.close()
+    assert read_index(path + '.2') == [(100, 0)]
+    assert read_index(path + '.1') == [(100, 0), (101, 5)]
+    assert read_index(path) == [(101, 0)]
+
+
+def test_log_file_rotates_time_index_with_compression(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    compressor = Compressor('gzip')
+    lf = LogFile(path, max_bytes=10, backup_count=1, compressor=compressor)
+    lf.write_lines([b'1111\n', b'2222\n', b'3333\n'], {0: 100, 1: 101})
+    lf.close()
+    compressor.close()
+    assert read_index(path + '.1.gz') == [(100, 0), (101, 5)]
+    assert read_index(path) == [(101, 0)]
@@ -0,0 +1,266 @@
+import datetime
+import re
+import threading
+import time
+
+import pytest
+
+from compose.logfiles import LogFile, Compressor
+from compose.logs import ServiceLog, LogFollower, grep, merge, parse_time, _grep_data
+
+
+def write_log(path, seconds, max_bytes=0, backup_count=0, compressor=None):
+    '''
+    Write 3 lines for each of the seconds, the lines tell their second.
+    '''
+    lf = LogFile(path, max_bytes=max_bytes, backup_count=backup_count, compressor=compressor)
+    for sec in seconds:
+        lf.write_lines([('%d-%d\n' % (sec, i)).encode('ascii') for i in range(3)], {0: sec})
+    lf.close()
+    if compressor is not None:
+        compressor.close()
+
+
+def read_all(service_log, **kwargs):
+    return b''.join(service_log.read(**kwargs))
+
+
+def test_parse_time():
+    today = datetime.date(2019, 1, 17)
+    start = int(time.mktime(datetime.datetime(2019, 1, 17, 10, 32).timetuple()))
+    assert parse_time('10:32', today) == (start, start + 60)
+    assert parse_time('10:32:05', today) == (start + 5, start + 6)
+    assert parse_time('2019-01-17 10:32') == (start, start + 60)
+    assert parse_time('2019-01-17T10:32:05') == (start + 5, start + 6)
+    midnight = int(time.mktime(datetime.datetime(2019, 1, 17).timetuple()))
+    assert parse_time('2019-01-17') == (midnight, midnight + 24 * 3600)
+    with pytest.raises(ValueError):
+        parse_time('yesterday')
+
+
+def test_service_log_no_files(tmpdir):
+    service_log = ServiceLog(str(tmpdir.join('web.log')))
+    assert service_log.segments() == []
+    assert read_all(service_log) == b''
+
+
+def test_service_log_segments(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    for name in ['web.log', 'web.log.1.gz', 'web.log.2', 'web.log.3.xz', 'web.log.5', 'web.log.rotated-10',
+                 'web.log.rotated-9', 'web.log.rotated-9.idx', 'web.log.idx', 'db.log']:
+        tmpdir.join(name).write('')
+    assert ServiceLog(path).segments() == [
+        path + '.3.xz', path + '.2', path + '.1.gz', path + '.rotated-9', path + '.rotated-10', path,
+    ]
+
+
+def test_service_log_read(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    write_log(path, [100, 101, 102])
+    service_log = ServiceLog(path)
+    assert read_all(service_log) == b'100-0\n100-1\n100-2\n101-0\n101-1\n101-2\n102-0\n102-1\n102-2\n'
+    assert read_all(service_log, since=101) == b'101-0\n101-1\n101-2\n102-0\n102-1\n102-2\n'
+    assert read_all(service_log, until=101) == b'100-0\n100-1\n100-2\n'
+    assert read_all(service_log, since=101, until=102) == b'101-0\n101-1\n101-2\n'
+    assert read_all(service_log, since=50, until=101) == b'100-0\n100-1\n100-2\n'
+    assert read_all(service_log, since=103) == b''
+    assert read_all(service_log, until=100) == b''
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'lzma'])
+def test_service_log_read_rotated(tmpdir, compression):
+    path = str(tmpdir.join('web.log'))
+    compressor = Compressor(compression) if compression else None
+    write_log(path, range(100, 110), max_bytes=40, backup_count=10, compressor=compressor)
+    service_log = ServiceLog(path)
+    assert len(service_log.segments()) == 5
+    expected = b''.join(('%d-%d\n' % (sec, i)).encode('ascii') for sec in range(100, 110) for i in range(3))
+    assert read_all(service_log) == expected
+    expected = b''.join(('%d-%d\n' % (sec, i)).encode('ascii') for sec in range(103, 106) for i in range(3))
+    assert read_all(service_log, since=103, until=106) == expected
+
+
+def test_service_log_read_skips_files_without_index_when_time_is_given(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    tmpdir.join('web.log').write('no time\n')
+    service_log = ServiceLog(path)
+    assert read_all(service_log) == b'no time\n'
+    assert read_all(service_log, since=100) == b''
+
+
+@pytest.mark.parametrize('content, count, expect', [
+    (b'', 3, b''),
+    (b'1\n2\n3\n4\n', 0, b''),
+    (b'1\n2\n3\n4\n', 1, b'4\n'),
+    (b'1\n2\n3\n4\n', 3, b'2\n3\n4\n'),
+    (b'1\n2\n3\n4\n', 4, b'1\n2\n3\n4\n'),
+    (b'1\n2\n3\n4\n', 10, b'1\n2\n3\n4\n'),
+    (b'1\n2\n3\n4', 2, b'3\n4'),
+    (b'1\n\n\n4\n', 3, b'\n\n4\n'),
+    (b'\n', 1, b'\n'),
+])
+def test_service_log_tail(tmpdir, monkeypatch, content, count, expect):
+    monkeypatch.setattr('compose.logs.READ_BLOCK_SIZE', 3)
+    tmpdir.join('web.log').write_binary(content)
+    assert b''.join(ServiceLog(str(tmpdir.join('web.log'))).tail(count)) == expect
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_service_log_tail_rotated(tmpdir, compression):
+    path = str(tmpdir.join('web.log'))
+    compressor = Compressor(compression) if compression else None
+    write_log(path, range(100, 110), max_bytes=40, backup_count=10, compressor=compressor)
+    service_log = ServiceLog(path)
+    assert b''.join(service_log.tail(2)) == b'109-1\n109-2\n'
+    assert b''.join(service_log.tail(8)) == b'107-1\n107-2\n108-0\n108-1\n108-2\n109-0\n109-1\n109-2\n'
+    assert b''.join(service_log.tail(100)) == read_all(service_log)
+
+
+def test_service_log_tail_reads_only_needed_files(tmpdir, monkeypatch):
+    path = str(tmpdir.join('web.log'))
+    write_log(path, range(100, 110), max_bytes=40, backup_count=10)
+    opened = []
+    original_tail = ServiceLog._tail
+    monkeypatch.setattr(ServiceLog, '_tail', staticmethod(lambda p, c: opened.append(p) or original_tail(p, c)))
+    assert b''.join(ServiceLog(path).tail(8)) == b'107-1\n107-2\n108-0\n108-1\n108-2\n109-0\n109-1\n109-2\n'
+    assert opened == [path, path + '.1']
+
+
+class FollowerThread(object):
+    '''
+    Collects what LogFollower yields in a separate thread.
+    '''
+    def __init__(self, path):
+        self.follower = LogFollower(path)
+        self.data = b''
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+        # Let the follower start watching
+        time.sleep(0.2)
+
+    def _run(self):
+        for block in self.follower.blocks():
+            self.data += block
+
+    def wait_for(self, data, timeout=5):
+        deadline = time.time() + timeout
+        while self.data != data and time.time() < deadline:
+            time.sleep(0.01)
+        return self.data
+
+    def stop(self):
+        self.follower.stop()
+        self._thread.join()
+
+
+def test_log_follower(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    tmpdir.join('web.log').write_binary(b'old\n')
+    follower = FollowerThread(path)
+    try:
+        lf = LogFile(path, max_bytes=20, backup_count=1)
+        lf.write_lines([b'1111\n'])
+        lf.flush()
+        assert follower.wait_for(b'1111\n') == b'1111\n'
+        # the file is rotated in between
+        lf.write_lines([b'2222\n', b'3333\n', b'4444\n'])
+        lf.flush()
+        assert follower.wait_for(b'1111\n2222\n3333\n4444\n') == b'1111\n2222\n3333\n4444\n'
+        lf.close()
+    finally:
+        follower.stop()
+
+
+def test_log_follower_waits_for_file_and_truncation(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    follower = FollowerThread(path)
+    try:
+        with open(path, 'ab', 0) as f:
+            f.write(b'1111\n2222\n')
+            assert follower.wait_for(b'1111\n2222\n') == b'1111\n2222\n'
+            f.truncate(0)
+            f.write(b'3\n')
+            assert follower.wait_for(b'1111\n2222\n3\n') == b'1111\n2222\n3\n'
+    finally:
+        follower.stop()
+
+
+def test_grep(tmpdir):
+    web = str(tmpdir.join('web.log'))
+    db = str(tmpdir.join('db.log'))
+    write_log(web, range(100, 110), max_bytes=40, backup_count=10, compressor=Compressor('gzip'))
+    write_log(db, [100, 105])
+    tmpdir.join('empty.log').write('')
+    tmpdir.join('no-index.log').write('105-1 no index\n')
+    service_logs = [
+        ('web', ServiceLog(web)),
+        ('db', ServiceLog(db)),
+        ('empty', ServiceLog(str(tmpdir.join('empty.log')))),
+        ('no-index', ServiceLog(str(tmpdir.join('no-index.log')))),
+        ('none', ServiceLog(str(tmpdir.join('none.log')))),
+    ]
+    expected = [
+        ('web', 101, b'101-1'),
+        ('web', 105, b'105-1'),
+        ('db', 105, b'105-1'),
+        ('no-index', None, b'105-1 no index'),
+    ]
+    assert list(grep(service_logs, br'^10[15]-1')) == expected
+    assert list(grep(service_logs, br'^10[15]-1', processes=1)) == expected
+    assert list(grep(service_logs, br'nothing')) == []
+
+
+def test_grep_no_services():
+    assert list(grep([], b'a')) == []
+
+
+def test_grep_data():
+    regex = re.compile(br'a|^$', re.MULTILINE)
+    assert _grep_data(regex, b'aa\nb\n\nca\nd') == [(0, b'aa'), (5, b''), (6, b'ca')]
+    assert _grep_data(re.compile(b'x'), b'') == []
+    assert _grep_data(re.compile(b'd$'), b'a\nd') == [(2, b'd')]
+
+
+def test_service_log_lines(tmpdir):
+    path = str(tmpdir.join('web.log'))
+    write_log(path, range(100, 104), max_bytes=40, backup_count=10, compressor=Compressor('gzip'))
+    service_log = ServiceLog(path)
+    assert list(service_log.lines()) == [(sec, ('%d-%d\n' % (sec, i)).encode('ascii'))
+                                         for sec in range(100, 104) for i in range(3)]
+    assert list(service_log.lines(since=101, until=103)) == [(sec, ('%d-%d\n' % (sec, i)).encode('ascii'))
+                                                             for sec in range(101, 103) for i in range(3)]
+    tmpdir.join('no-index.log').write('a\nb\n')
+    assert list(ServiceLog(str(tmpdir.join('no-index.log'))).lines()) == [(None, b'a\n'), (None, b'b\n')]
+
+
+def test_merge(tmpdir):
+    web = str(tmpdir.join('web.log'))
+    db = str(tmpdir.join('db.log'))
+    write_log(web, [100, 102, 103], max_bytes=20, backup_count=10)
+    write_log(db, [101, 102, 104])
+    service_logs = [ServiceLog(web), ServiceLog(db), ServiceLog(str(tmpdir.join('none.log')))]
+    seconds = [(100, 'web'), (101, 'db'), (102, 'web'), (102, 'db'), (103, 'web'), (104, 'db')]
+    assert [line[:5] for line in merge(service_logs)] == [b'%d-%d' % (sec, i) for sec, _ in seconds for i in range(3)]
+    assert list(merge(service_logs, since=102, until=104)) == \
+        [b'102-0\n', b'102-1\n', b'102-2\n', b'102-0\n', b'102-1\n', b'102-2\n', b'103-0\n', b'103-1\n', b'103-2\n']
+    assert list(merge([])) == []
+
+
+def test_merge_is_lazy(tmpdir, monkeypatch):
+    web = str(tmpdir.join('web.log'))
+    db = str(tmpdir.join('db.log'))
+    write_log(web, [100, 102])
+    write_log(db, [101])
+    read = []
+    original_lines = ServiceLog.lines
+
+    def recording_lines(self, since=None, until=None):
+        for epoch, line in original_lines(self, since, until):
+            read.append(line)
+            yield epoch, line
+
+    monkeypatch.setattr(ServiceLog, 'lines', recording_lines)
+    merged = merge([ServiceLog(web), ServiceLog(db)])
+    assert next(merged) == b'100-0\n'
+    # Only the head line of each service is read
+    assert read == [b'100-0\n', b'101-0\n']
@@ -39,3 +39,8 @@ def test_message_properties():
     assert m.name == 'web1'
     assert m.time == my_time
     assert m.color == 'red'
+
+
+def test_line_text():
+    assert Line(b'caf\xc3\xa9 \xff\n', 'web1').text() == u'caf\xe9 \ufffd\n'
+    assert Line('hello', 'web1').text() == 'hello'
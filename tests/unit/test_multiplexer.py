@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+import pytest
+from mock import Mock
+
+from compose.multiplexing import OutputMultiplexer, split_lines, READ_CHUNK_SIZE
+
+
+def make_child(returncode=0):
+    r, w = os.pipe()
+    child = Mock(stdout=os.fdopen(r, 'rb'), returncode=returncode)
+    child.poll.return_value = returncode
+    return child, w
+
+
+def run_until_exited(multiplexer, children_count):
+    exited = []
+    done = threading.Event()
+    def on_exit(rc):
+        exited.append(rc)
+        if len(exited) == children_count:
+            done.set()
+    multiplexer.launch()
+    return exited, done, on_exit
+
+
+def test_lines_are_split_and_carried_over():
+    mp = OutputMultiplexer()
+    child, w = make_child(returncode=3)
+    lines = []
+    exited, done, on_exit = run_until_exited(mp, 1)
+    mp.add(child, lines.append, on_exit)
+    os.write(w, b'hello\nwor')
+    os.write(w, b'ld\nbye')
+    os.close(w)
+    assert done.wait(5)
+    mp.stop()
+    assert b''.join(lines) == b'hello\nworld\nbye'
+    assert lines[-1] == b'bye'
+    assert all(batch.endswith(b'\n') for batch in lines[:-1])
+    assert exited == [3]
+    assert child.stdout.closed
+
+
+def test_many_children_single_thread():
+    mp = OutputMultiplexer()
+    children = [make_child(returncode=i) for i in range(20)]
+    lines = []
+    exited, done, on_exit = run_until_exited(mp, len(children))
+    threads_before = threading.active_count()
+    for child, w in children:
+        mp.add(child, lines.append, on_exit)
+    assert threading.active_count() == threads_before
+    for i, (_, w) in enumerate(children):
+        os.write(w, b'line %d\n' % i)
+        os.close(w)
+    assert done.wait(5)
+    mp.stop()
+    assert sorted(lines) == sorted(b'line %d\n' % i for i in range(20))
+    assert sorted(exited) == list(range(20))
+
+
+def test_batch_of_lines_is_sent_at_once():
+    mp = OutputMultiplexer()
+    child, w = make_child()
+    lines = []
+    exited, done, on_exit = run_until_exited(mp, 1)
+    os.write(w, b''.join(b'line %d\n' % i for i in range(1000)))
+    os.close(w)
+    mp.add(child, lines.append, on_exit)
+    assert done.wait(5)
+    mp.stop()
+    assert lines == [b''.join(b'line %d\n' % i for i in range(1000))]
+    assert exited == [0]
+
+
+def test_child_without_pipe_is_reaped():
+    mp = OutputMultiplexer(reap_interval_sec=0.01)
+    child = Mock(stdout=None, returncode=0)
+    child.poll.side_effect = [None, None, 0]
+    exited, done, on_exit = run_until_exited(mp, 1)
+    mp.add(child, Mock(), on_exit)
+    assert done.wait(5)
+    mp.stop()
+    assert exited == [0]
+
+
+@pytest.mark.parametrize('carry, chunk, expect', [
+    (b'', b'', (b'', b'')),
+    (b'', b'abc', (b'', b'abc')),
+    (b'ab', b'c', (b'', b'abc')),
+    (b'', b'a\nb\n', (b'a\nb\n', b'')),
+    (b'x', b'a\nb\n', (b'xa\nb\n', b'')),
+    (b'x', b'a\nb\nc', (b'xa\nb\n', b'c')),
+    (b'', b'\n', (b'\n', b'')),
+])
+def test_split_lines(carry, chunk, expect):
+    assert split_lines(carry, chunk) == expect
+
+
+def test_split_lines_too_long_line_is_not_carried():
+    chunk = b'a' * READ_CHUNK_SIZE
+    assert split_lines(b'', chunk) == (chunk, b'')
+
+
+def test_reading_is_paused_without_capacity():
+    mp = OutputMultiplexer()
+    child, w = make_child()
+    lines = []
+    capacity = threading.Event()
+    exited, done, on_exit = run_until_exited(mp, 1)
+    mp.add(child, lines.append, on_exit, capacity.is_set)
+    os.write(w, b'1\n')
+    time.sleep(0.1)
+    os.write(w, b'2\n')
+    os.close(w)
+    assert not done.wait(0.2)
+    assert lines == [b'1\n']
+    capacity.set()
+    mp.resume()
+    assert done.wait(5)
+    mp.stop()
+    assert lines == [b'1\n', b'2\n']
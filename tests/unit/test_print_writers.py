@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+import io
+import time
+import datetime
 try:
     from StringIO import StringIO
 except ImportError:
@@ -10,7 +13,9 @@ import mock
 import pytest
 import colored
 
-from compose.printing import SimplePrintWriter, ColoredPrintWriter, WritersFactory
+from compose.printing import SimplePrintWriter, ColoredPrintWriter, WritersFactory, RotatingFileLogWriter, \
+    JsonLinesWriter
+from compose.service import Service
 
 
 @mock.patch('sys.stdout', new_callable=StringIO, create=True)
@@ -78,6 +83,14 @@ def test_writers_factory_no_file_out():
     assert isinstance(ws[0], SimplePrintWriter)
 
 
+def test_writers_factory_json_format():
+    config = mock.Mock()
+    config.logging = {'format': 'json'}
+    ws = WritersFactory(config, '/path/to/store', True).create()
+    assert len(ws) == 1
+    assert isinstance(ws[0], JsonLinesWriter)
+
+
 @pytest.mark.parametrize('is_enabled, expect_loggers', [
     (True, 2),
     (False, 1),
@@ -92,3 +105,173 @@ def test_writers_factory_logging_to_file_with_enabled_flag(is_enabled, expect_lo
     config.services = {}
     ws = WritersFactory(config, '/path/to/store', True).create()
     assert len(ws) == expect_loggers
+
+
+def test_rotating_file_log_writer(tmpdir):
+    web = Service(name='web', cmd='true', log_to_file=str(tmpdir.join('my-web.log')))
+    db = Service(name='db', cmd='true')
+    w = RotatingFileLogWriter(str(tmpdir), [web, db], 0, 0, batch_lines=2)
+    w.write('web 1', service='web')
+    w.write('db 1', service='db')
+    w.write('system', service='system')
+    w.write('web 2', service='web')
+    w.idle()
+    w.write('db 2', service='db')
+    w.close()
+    assert tmpdir.join('my-web.log').read() == 'web 1\nweb 2\n'
+    assert tmpdir.join('db.log').read() == 'db 1\ndb 2\n'
+
+
+def test_writers_factory_redirects_output_when_logging_to_file_only():
+    config = mock.Mock()
+    config.logging = {
+        'toStdout': False,
+        'toFile': {
+            'enabled': True,
+        },
+    }
+    s = Service(name='web', cmd='true')
+    WritersFactory(config, '/path/to/store', True).redirect_output(s)
+    assert s.output_file == '/path/to/store/web.log'
+    config.logging['toStdout'] = True
+    s = Service(name='web', cmd='true')
+    WritersFactory(config, '/path/to/store', True).redirect_output(s)
+    assert s.output_file is None
+
+
+def test_rotating_file_log_writer_marks_time(tmpdir):
+    db = Service(name='db', cmd='true')
+    w = RotatingFileLogWriter(str(tmpdir), [db], 0, 0)
+    t1 = datetime.datetime(2019, 1, 17, 13, 1, 13, 100)
+    t2 = datetime.datetime(2019, 1, 17, 13, 1, 13, 900)
+    t3 = datetime.datetime(2019, 1, 17, 13, 1, 14)
+    w.write('line 1', service='db', time=t1)
+    w.write('line 2', service='db', time=t1)
+    w.write('line 3', service='db', time=t2)
+    w.write('line 4', service='db', time=t3)
+    batch = w._batch['db']
+    epoch = int(time.mktime(t1.timetuple()))
+    assert batch == ([b'line 1\n', b'line 2\n', b'line 3\n', b'line 4\n'], {0: epoch, 3: epoch + 1})
+    w.close()
+
+
+class TTYStringIO(StringIO):
+    def isatty(self):
+        return True
+
+
+@mock.patch('sys.stdout', new_callable=TTYStringIO, create=True)
+def test_buffered_print_writer_tty(mock_stdout):
+    w = SimplePrintWriter(buffered=True, flush_interval=10)
+    assert not w.block_buffered
+    w.write('line 1')
+    w.write('line 2')
+    assert mock_stdout.getvalue() == ''
+    w.idle()
+    assert mock_stdout.getvalue() == 'line 1\nline 2\n'
+    w.flush_interval = 0
+    w.write('line 3')
+    assert mock_stdout.getvalue() == 'line 1\nline 2\nline 3\n'
+
+
+@mock.patch('sys.stdout', new_callable=StringIO, create=True)
+def test_buffered_print_writer_no_tty(mock_stdout):
+    w = SimplePrintWriter(buffered=True, buffer_size=20, flush_interval=0)
+    assert w.block_buffered
+    w.write('line 1')
+    w.write('line 2')
+    w.idle()
+    assert mock_stdout.getvalue() == ''
+    w.write('line 3')
+    assert mock_stdout.getvalue() == 'line 1\nline 2\nline 3\n'
+    w.write('line 4')
+    w.close()
+    assert mock_stdout.getvalue() == 'line 1\nline 2\nline 3\nline 4\n'
+
+
+@mock.patch('sys.stdout', new_callable=StringIO, create=True)
+def test_buffered_colored_print_writer(mock_stdout):
+    colored.set_tty_aware(False)
+    w = ColoredPrintWriter(buffered=True)
+    w.write('is there a color?', color='red')
+    w.close()
+    assert mock_stdout.getvalue() == '\033[38;5;1mis there a color?\033[0m\n'
+
+
+@mock.patch('sys.stdout', new_callable=StringIO, create=True)
+def test_colored_print_writer_resolves_color_on_register(mock_stdout):
+    colored.set_tty_aware(False)
+    w = ColoredPrintWriter()
+    w.register(Service(name='web1', cmd='cat', color='green'))
+    with mock.patch('colored.fg') as fg_mock:
+        w.write('is there a color?', color='green')
+        w.write('is there a color still?', color='green')
+        fg_mock.assert_not_called()
+    assert mock_stdout.getvalue() == \
+        '\033[38;5;2mis there a color?\033[0m\n\033[38;5;2mis there a color still?\033[0m\n'
+
+
+class BinaryStringIO(StringIO):
+    def __init__(self):
+        StringIO.__init__(self)
+        self.buffer = io.BytesIO()
+
+
+@mock.patch('sys.stdout', new_callable=BinaryStringIO, create=True)
+def test_binary_print_writer(mock_stdout):
+    w = SimplePrintWriter(binary=True)
+    w.write(b'caf\xc3\xa9 \xff')
+    assert mock_stdout.buffer.getvalue() == b'caf\xc3\xa9 \xff\n'
+    assert mock_stdout.getvalue() == ''
+    w = SimplePrintWriter(buffered=True, binary=True)
+    w.write(b'line 1')
+    w.write(b'line 2')
+    w.close()
+    assert mock_stdout.buffer.getvalue() == b'caf\xc3\xa9 \xff\nline 1\nline 2\n'
+
+
+@mock.patch('sys.stdout', new_callable=BinaryStringIO, create=True)
+def test_binary_colored_print_writer(mock_stdout):
+    colored.set_tty_aware(False)
+    w = ColoredPrintWriter(buffered=True, binary=True)
+    w.write(b'is there a color?', color='red')
+    w.write(b'no color')
+    w.close()
+    assert mock_stdout.buffer.getvalue() == b'\033[38;5;1mis there a color?\033[0m\nno color\n'
+
+
+def test_rotating_file_log_writer_binary(tmpdir):
+    db = Service(name='db', cmd='true')
+    w = RotatingFileLogWriter(str(tmpdir), [db], 0, 0)
+    w.write(b'db \xff', service='db')
+    w.close()
+    assert tmpdir.join('db.log').read_binary() == b'db \xff\n'
+
+
+@mock.patch('sys.stdout', new_callable=StringIO, create=True)
+def test_json_lines_writer(mock_stdout):
+    t = datetime.datetime(2019, 1, 17, 15, 1, 13, 100)
+    epoch = int(time.mktime(t.timetuple()))
+    web = Service(name='web', cmd='true')
+    web.pid = 42
+    w = JsonLinesWriter()
+    w.register(web)
+    w.write(u'say "hi"\tü', service='web', time=t)
+    w.write('web started', service='system', time=t)
+    w.write('no time', service='web')
+    web.pid = 43
+    w.write('restarted', service='web', time=t)
+    assert mock_stdout.getvalue().splitlines() == [
+        '{"service":"web","pid":42,"stream":"stdout","time":%d.000100,"message":"say \\"hi\\"\\t\\u00fc"}' % epoch,
+        '{"service":"system","pid":null,"stream":"system","time":%d.000100,"message":"web started"}' % epoch,
+        '{"service":"web","pid":42,"stream":"stdout","time":null,"message":"no time"}',
+        '{"service":"web","pid":43,"stream":"stdout","time":%d.000100,"message":"restarted"}' % epoch,
+    ]
+
+
+@mock.patch('sys.stdout', new_callable=BinaryStringIO, create=True)
+def test_binary_json_lines_writer(mock_stdout):
+    w = JsonLinesWriter(binary=True)
+    w.write(b'caf\xc3\xa9 \xff', service='db')
+    assert mock_stdout.buffer.getvalue() == \
+        b'{"service":"db","pid":null,"stream":"system","time":null,"message":"caf\\u00e9 \\ufffd"}\n'
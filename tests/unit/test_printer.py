@@ -3,6 +3,7 @@ import time
 import os
 
 import pytest
+from mock import Mock
 
 from compose.printing import Printer
 from compose.messaging import Stop, Line, SYSTEM_LABEL
@@ -27,10 +28,19 @@ class StoreWriter(object):
     def __init__(self):
         self.data = ''
 
-    def write(self, msg, color=None, service=None):
+    def write(self, msg, color=None, service=None, time=None):
         self.data = msg
 
 
+class StoreAllWriter(object):
+    'Mock writer that keeps all the written messages'
+    def __init__(self):
+        self.data = []
+
+    def write(self, msg, color=None, service=None, time=None):
+        self.data.append(msg)
+
+
 def test_printer_does_not_allow_other_mesage_types():
     p = Printer([StoreWriter()])
     with pytest.raises(RuntimeError) as execinfo:
@@ -110,3 +120,75 @@ def test_write(timezone_fixture, message, time_format, use_prefix, expect):
     p.adjust_width(s1)
     p.write(message)
     assert w.data == expect
+
+
+def test_write_multiple_lines_and_writers(timezone_fixture):
+    w1 = StoreAllWriter()
+    w2 = StoreAllWriter()
+    p = Printer([w1, w2])
+    p.write(Line(data=b'one\ntwo\n', name='web1', time=datetime.fromtimestamp(1547730073)))
+    assert w1.data == ['13:01:13 web1   | one', '13:01:13 web1   | two']
+    assert w2.data == w1.data
+
+
+def test_write_to_writer_without_prefix(timezone_fixture):
+    w1 = StoreAllWriter()
+    w2 = StoreAllWriter()
+    w2.use_prefix = False
+    p = Printer([w1, w2])
+    p.write(Line(data='one\ntwo\n', name='web1', time=datetime.fromtimestamp(1547730073)))
+    assert w1.data == ['13:01:13 web1   | one', '13:01:13 web1   | two']
+    assert w2.data == ['one', 'two']
+
+
+def test_write_binary(timezone_fixture):
+    w = StoreAllWriter()
+    p = Printer([w], binary=True)
+    p.write(Line(data=b'caf\xc3\xa9\n\xff\n', name='web1', time=datetime.fromtimestamp(1547730073)))
+    p.write(Line(data='started\n', name=SYSTEM_LABEL, time=datetime.fromtimestamp(1547730074)))
+    assert w.data == [
+        b'13:01:13 web1   | caf\xc3\xa9',
+        b'13:01:13 web1   | \xff',
+        b'13:01:14 system | started',
+    ]
+
+
+def test_write_binary_no_prefix():
+    w = StoreAllWriter()
+    p = Printer([w], use_prefix=False, binary=True)
+    p.write(Line(data=b'', name='web1'))
+    assert w.data == [b'']
+
+
+def test_write_after_width_adjusted():
+    w = StoreAllWriter()
+    p = Printer([w], time_format='')
+    p.write(Line(data='one', name='web1'))
+    p.adjust_width(Service(name='web_1234567890', cmd='cat'))
+    p.write(Line(data='two', name='web1'))
+    assert w.data == [' web1   | one', ' web1           | two']
+
+
+def test_write_time_changes_each_second(timezone_fixture):
+    w = StoreAllWriter()
+    p = Printer([w])
+    for ts in [1547730073.1, 1547730073.9, 1547730074.0, 1547730073.5]:
+        p.write(Line(data='hi', name='web1', time=datetime.fromtimestamp(ts)))
+    assert [d[:8] for d in w.data] == ['13:01:13', '13:01:13', '13:01:14', '13:01:13']
+
+
+def test_write_subsecond_time_format(timezone_fixture):
+    w = StoreAllWriter()
+    p = Printer([w], time_format='%S.%f')
+    for ts in [1547730073.1, 1547730073.9]:
+        p.write(Line(data='hi', name='web1', time=datetime.fromtimestamp(ts)))
+    assert [d[:9] for d in w.data] == ['13.100000', '13.900000']
+
+
+def test_register():
+    w = Mock()
+    p = Printer([w])
+    s = Service(name='web_1234567890', cmd='cat')
+    p.register(s)
+    assert p.width == 14
+    w.register.assert_called_once_with(s)
@@ -22,3 +22,14 @@ def test_register_service():
     sch.register_service(Service(name='web2', cmd='fake'))
     assert sch.returncode is None
     assert len(sch._pool.all()) == 2
+
+
+def test_start_runs_till_all_exited():
+    printer = Mock()
+    sch = Scheduler(printer)
+    sch.register_service(Service(name='web1', cmd='true'))
+    sch.register_service(Service(name='web2', cmd='local-compose-unknown-command'))
+    sch.start()
+    written = [c[0][0].data for c in printer.write.call_args_list]
+    assert 'web1 stopped (rc=0)\n' in written
+    assert 'web2 stopped (rc=None)\n' in written
@@ -0,0 +1,48 @@
+import time
+
+from compose.runtime import Supervisor, ExecutorsPool, Executor
+from compose.messaging import EventBus, Restart
+from compose.service import Service
+
+
+def make_failed_executor(eb, name, wait):
+    srv = Service(name, 'cat', readiness={'retry': {'attempts': 2, 'wait': wait}})
+    executor = Executor(eb, srv)
+    executor.returncode = 1
+    srv.readiness.update_service_state(1)
+    return executor
+
+
+def test_restarts_are_independent_and_ordered_by_deadline():
+    eb = EventBus()
+    pool = ExecutorsPool()
+    slow = make_failed_executor(eb, 'slow', 0.3)
+    fast = make_failed_executor(eb, 'fast', 0.05)
+    sv = Supervisor(eb, pool)
+    sv.launch()
+    try:
+        started = time.time()
+        sv.schedule_restart(slow)
+        sv.schedule_restart(fast)
+        first = eb.receive(timeout=5)
+        first_at = time.time() - started
+        second = eb.receive(timeout=5)
+        second_at = time.time() - started
+    finally:
+        sv.stop()
+    assert isinstance(first, Restart)
+    assert first.data == {'name': 'fast'}
+    assert 0.05 <= first_at < 0.3
+    assert isinstance(second, Restart)
+    assert second.data == {'name': 'slow'}
+    assert 0.3 <= second_at < 1
+
+
+def test_schedule_restart_resets_executor():
+    eb = EventBus()
+    executor = make_failed_executor(eb, 'web1', 10)
+    sv = Supervisor(eb, ExecutorsPool())
+    assert executor.needs_restart() == (True, 10)
+    sv.schedule_restart(executor)
+    assert executor.returncode is None
+    assert not executor.needs_restart()[0]
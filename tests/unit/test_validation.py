@@ -0,0 +1,81 @@
+import copy
+
+import pytest
+import jsonschema
+
+from compose.configuration import _schema_validator
+from compose.schema import JSON_SCHEMA
+from compose.validation import compile_schema
+
+
+VALID_CONFIGS = [
+    {'version': '1'},
+    {'version': '1', 'settings': {'logging': {'toFile': {'enabled': True, 'maxSize': 10}, 'buffer': {}}}},
+    {
+        'version': '1',
+        'settings': {'envMaps': {'common': {'A': 1, 'B': None, 'C': 'c', 'D': True}}},
+        'services': {
+            'web.1': {
+                'run': 'ruby server.rb',
+                'env': {'FOO': 1.5},
+                'envFromMap': ['common'],
+                'readiness': {'retry': {'attempts': 3}},
+            },
+            'db': {'run': 'postgres', 'readiness': {}},
+        },
+    },
+]
+
+INVALID_CONFIGS = [
+    None,
+    {},
+    {'version': 1},
+    {'version': '1', 'settings': {'logging': {'format': 'xml'}}},
+    {'version': '1', 'settings': {'logging': {'buffer': {'maxLines': 0}}}},
+    {'version': '1', 'settings': {'logging': {'toFile': {'compressionLevel': 10}}}},
+    {'version': '1', 'settings': {'logging': {'usePrefix': 1}}},
+    {'version': '1', 'settings': {'logging': {'toFile': {'maxSize': True}}}},
+    {'version': '1', 'services': {'web': {}}},
+    {'version': '1', 'services': {'web': {'run': 'x', 'env': {'A': [1]}}}},
+    {'version': '1', 'services': {'web': {'run': 'x', 'envFromMap': []}}},
+    {'version': '1', 'services': {'web': {'run': 'x', 'envFromMap': ['a', 'a']}}},
+    {'version': '1', 'services': {'web': {'run': 'x', 'envFromMap': [1]}}},
+    {'version': '1', 'services': {'web': {'run': 'x', 'readiness': {'retry': {'waitSeconds': 'no'}}}}},
+    # default of attempts is not an integer
+    {'version': '1', 'services': {'web': {'run': 'x', 'readiness': {'retry': {}}}}},
+]
+
+
+@pytest.mark.parametrize('config', VALID_CONFIGS)
+def test_compiled_schema_accepts_and_fills_defaults_like_jsonschema(config):
+    fast = copy.deepcopy(config)
+    slow = copy.deepcopy(config)
+    assert compile_schema(JSON_SCHEMA)(fast) is True
+    _schema_validator().validate(slow)
+    assert fast == slow
+
+
+@pytest.mark.parametrize('config', INVALID_CONFIGS)
+def test_compiled_schema_rejects_like_jsonschema(config):
+    assert compile_schema(JSON_SCHEMA)(copy.deepcopy(config)) is False
+    with pytest.raises(jsonschema.ValidationError):
+        _schema_validator().validate(copy.deepcopy(config))
+
+
+def test_compiled_schema_is_conservative():
+    check = compile_schema({'type': 'integer'})
+    # jsonschema treats integral floats as integers, the compiled check leaves them to it
+    assert check(1) is True
+    assert check(1.0) is False
+    assert check(True) is False
+
+
+@pytest.mark.parametrize('schema', [
+    {'oneOf': [{'type': 'string'}]},
+    {'$ref': 'http://example.com/schema.json'},
+    {'additionalProperties': {'type': 'string'}},
+    {'enum': [1, 2]},
+])
+def test_compile_schema_fails_on_unsupported_schema(schema):
+    with pytest.raises(ValueError):
+        compile_schema(schema)